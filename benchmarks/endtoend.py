@@ -0,0 +1,261 @@
+"""
+End-to-end benchmark of PictureGameBot against the offline fake reddit, on
+scripted scenarios: solved rounds of growing size, an abandoned round and a
+takeover after the winner didn't post. Reports the API calls per round,
+the latency of the bot's passes and the memory they allocate.
+
+API call counts are deterministic, so they can be compared to a saved run
+to catch regressions; timings are only reported.
+
+Usage: python -m benchmarks.endtoend [--sizes 10,1000,50000]
+                                     [--save FILE] [--compare FILE]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+from benchmarks import fakereddit
+from benchmarks.matcher import synthetic_thread
+from picturegamebot.bot import PictureGameBot
+from picturegamebot.challenges import load_challenges
+
+BOT = ("PictureGameBot", "botpass")
+PLAYER = ("PictureGame", "hunter2")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHALLENGES = os.path.join(ROOT, "challenges.txt")
+WORDLIST = os.path.join(ROOT, "wordlist.txt")
+# Made by the challenge pool in the background, whenever its thread runs.
+BACKGROUND = ("streetview", "imgur_upload")
+
+
+def make_world(players=1000, seed=0):
+    """
+    Internal: Create a fake subreddit in the state the bot expects: the bot
+      and player accounts, the accounts page, a leaderboard and a few
+      finished rounds.
+
+    players - The number of users on the leaderboard.
+    seed    - The random seed, so that runs are comparable.
+
+    Returns a benchmarks.fakereddit.World.
+    """
+    rand = random.Random(seed)
+    world = fakereddit.World()
+    world.account(*BOT)
+    player = world.account(*PLAYER)
+    world.edit_wiki("accounts", "#bot>{:s}:{:s}".format(*PLAYER))
+    rows = sorted(((rand.randint(1, 40), "user{:d}".format(n))
+                   for n in range(players)), reverse=True)
+    world.edit_wiki("leaderboard", "".join(
+        ["# Leaderboard\n\n", "Rank | Username | Rounds won | Total |\n",
+         "|:--:|:--:|:--|:--:|:--:|\n"] +
+        ["{:d} | {:s} | {:s} | {:d}\n".format(
+            rank, name, ", ".join(str(rank * 100 + i) for i in range(wins)),
+            wins) for rank, (wins, name) in enumerate(rows, 1)]))
+    for number in range(1, 4):
+        post = world.submit(player, "[Round {:d}] Old round".format(number),
+                            created_utc=world.clock() - 86400 + number)
+        post.link_flair_text = "ROUND OVER"
+    return world
+
+def guesser(world, seed=0):
+    """
+    Internal: Make players answer the bot's challenges as soon as they are
+      posted, one guess per known challenge, so that the challenge ends on
+      its first pass.
+
+    Returns nothing.
+    """
+    rand = random.Random(seed)
+    answers = [c.answers.split(";")[0] for c in load_challenges(CHALLENGES)]
+
+    def answer(post):
+        if "[Bot]" in post.title:
+            for alias in answers:
+                author = fakereddit.Redditor(
+                    world, "guesser{:d}".format(rand.randint(0, 99)))
+                world.comment(post.name, author, "Is it {:s}?".format(alias))
+    world.on_submit.append(answer)
+
+def guesses(world, post, count, seed=0):
+    """
+    Internal: Post guesses on a round.
+
+    Returns a list of the Comments.
+    """
+    rand = random.Random(seed)
+    return [world.comment(post.name, fakereddit.Redditor(
+        world, "user{:d}".format(rand.randint(0, 4999))), body)
+            for body in synthetic_thread(count, seed)]
+
+def solved_round(world, comments, passes=10):
+    """
+    Scenario: A round gets `comments` guesses over `passes` passes, and the
+      OP marks one of the last ones as correct.
+    """
+    player = fakereddit.Redditor(world, PLAYER[0])
+    post = world.submit(player, "[Round 4] Where is this?",
+                        created_utc=world.clock() - 3600)
+    for step in range(passes):
+        batch = guesses(world, post, comments // passes, seed=step)
+        if step == passes - 1 and batch:
+            world.comment(batch[-1].name, player, "+correct")
+        yield
+
+def abandoned_round(world, comments):
+    """
+    Scenario: A round with `comments` wrong guesses is 3 hours old, so the
+      bot abandons it, takes over with a challenge that gets answered, and
+      hands out that win.
+    """
+    player = fakereddit.Redditor(world, PLAYER[0])
+    post = world.submit(player, "[Round 4] Where is this?",
+                        created_utc=world.clock() - 181 * 60)
+    guesses(world, post, comments)
+    for _ in range(4):
+        yield
+
+def takeover(world, comments):
+    """
+    Scenario: A round with `comments` guesses was won 46 minutes ago and the
+      winner never posted, so the bot warns them, takes over and hands out
+      the win of its own challenge.
+    """
+    player = fakereddit.Redditor(world, PLAYER[0])
+    post = world.submit(player, "[Round 4] Where is this?",
+                        created_utc=world.clock() - 120 * 60)
+    post.link_flair_text = "ROUND OVER"
+    batch = guesses(world, post, comments)
+    winner = batch[-1]
+    winner.created_utc = world.clock() - 47 * 60
+    world.comment(winner.name, player, "+correct",
+                  created_utc=world.clock() - 46 * 60)
+    for _ in range(3):
+        yield
+
+def workspace(directory):
+    """
+    Internal: Prepare a directory for a bot to run in, with the files it
+      reads and an empty tmp directory.
+
+    Returns the directory.
+    """
+    os.makedirs(os.path.join(directory, "tmp"))
+    shutil.copy(CHALLENGES, directory)
+    shutil.copy(WORDLIST, directory)
+    return directory
+
+def run(scenario, *args, trace=False):
+    """
+    Internal: Start a bot on a fresh world and run it for a pass after each
+      step of a scenario. Each pass is one step of the main loop, then
+      waits for the outbox so that its calls are counted.
+
+    scenario - A generator function taking the world and args.
+    trace    - Whether to measure the memory allocated by each pass, which
+               makes the passes slower.
+
+    Returns a dict of results.
+    """
+    world = make_world()
+    guesser(world)
+    bot = PictureGameBot(gamebot=BOT, transport=fakereddit.Transport(world),
+                         imgur=fakereddit.Imgur(world))
+    # Wait for the leaderboard to load, so that its calls count as startup.
+    bot.leaderboard.rounds(BOT[0])
+    startup = sum(number for endpoint, number in world.calls.items()
+                  if endpoint not in BACKGROUND)
+    world.calls.clear()
+    latencies, peaks = [], []
+    for _ in scenario(world, *args):
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        bot.step()
+        latencies.append(time.perf_counter() - start)
+        if trace:
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        bot.outbox.join()
+    bot.leaderboard.flush()
+    calls = dict((endpoint, number) for endpoint, number
+                 in world.calls.items() if endpoint not in BACKGROUND)
+    return {"startup_calls": startup, "calls": sum(calls.values()),
+            "endpoints": calls, "passes": len(latencies),
+            "latency_mean": sum(latencies) / len(latencies),
+            "latency_max": max(latencies),
+            "memory_peak": max(peaks) if peaks else None,
+            "wins": len([m for m in world.messages
+                         if m[1].startswith("Congratulations")])}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="10,1000,50000",
+                        help="comma separated comment counts")
+    parser.add_argument("--save", help="write the results to this file")
+    parser.add_argument("--compare",
+                        help="fail if more API calls are made than in this "
+                             "saved run")
+    options = parser.parse_args()
+    sizes = [int(size) for size in options.sizes.split(",")]
+    scenarios = [("solved/{:d}".format(size), solved_round, size)
+                 for size in sizes]
+    scenarios += [("abandoned/{:d}".format(sizes[-1]), abandoned_round,
+                   sizes[-1]),
+                  ("takeover/{:d}".format(sizes[-1]), takeover, sizes[-1])]
+
+    for name in ("REDDIT_USERNAME", "REDDIT_PASSWORD", "METRICS_PORT"):
+        os.environ.pop(name, None)
+    home = os.getcwd()
+    root = tempfile.mkdtemp(prefix="picturegame-")
+    results = {}
+    try:
+        for name, scenario, size in scenarios:
+            directory = os.path.join(root, name.replace("/", "-"))
+            os.chdir(workspace(directory))
+            result = run(scenario, size)
+            os.chdir(workspace(os.path.join(directory, "traced")))
+            result["memory_peak"] = run(scenario, size,
+                                        trace=True)["memory_peak"]
+            os.chdir(home)
+            results[name] = result
+    finally:
+        os.chdir(home)
+        shutil.rmtree(root, ignore_errors=True)
+
+    print("\n{:<18s} {:>7s} {:>6s} {:>6s} {:>10s} {:>10s} {:>9s}".format(
+        "scenario", "startup", "calls", "passes", "mean ms", "max ms",
+        "peak KiB"))
+    for name, result in results.items():
+        print("{:<18s} {:>7d} {:>6d} {:>6d} {:>10.1f} {:>10.1f} {:>9.0f}"
+              .format(name, result["startup_calls"], result["calls"],
+                      result["passes"], result["latency_mean"] * 1000,
+                      result["latency_max"] * 1000,
+                      result["memory_peak"] / 1024))
+        print("    " + ", ".join("{:s}={:d}".format(endpoint, number)
+                                  for endpoint, number in
+                                  sorted(result["endpoints"].items())))
+    if options.save:
+        with open(options.save, "w") as saved:
+            json.dump(results, saved, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as saved:
+            baseline = json.load(saved)
+        worse = [name for name, result in results.items()
+                 if name in baseline
+                 and result["calls"] > baseline[name]["calls"]]
+        for name in worse:
+            print("REGRESSION: {:s} made {:d} calls, {:d} before.".format(
+                name, results[name]["calls"], baseline[name]["calls"]))
+        if worse:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,660 @@
+"""
+An in-process stand-in for reddit and Imgur, implementing the praw calls the
+bot makes, so that PictureGameBot can be run and measured offline.
+
+Every call that would be an HTTP request is counted in World.calls, and
+listings count one request per page of 100 things, like praw. Like praw,
+reads are cached for 30 seconds unless their URL is evicted, and writes
+need a logged in session.
+"""
+
+import copy
+import csv
+import html
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from hashlib import sha1
+from itertools import count, islice
+
+import praw
+
+PAGE = 100  # Things per listing page.
+CACHE_SECONDS = 30  # How long praw's handler keeps a response.
+
+
+def base36(number):
+    """
+    Internal: Format a number the way reddit formats ids.
+
+    Returns a String.
+    """
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    text = ""
+    while True:
+        number, digit = divmod(number, 36)
+        text = digits[digit] + text
+        if not number:
+            return text
+
+def render_html(markdown):
+    """
+    Internal: Render the subset of markdown the bot writes to the wiki (a
+      title, links and one table) to HTML, escaped like reddit's
+      content_html.
+
+    markdown - The content of a wiki page.
+
+    Returns a String.
+    """
+    parts = ['<div class="md">']
+    table = None
+    for line in markdown.splitlines():
+        if "|" in line and re.match(r"^[\s|:-]+$", line):
+            continue  # The alignment row.
+        if "|" in line:
+            cells = [html.escape(cell.strip(), quote=False)
+                     for cell in line.strip().strip("|").split("|")]
+            if table is None:
+                table = []
+                parts.append("<table><thead><tr>{:s}</tr></thead><tbody>"
+                             .format("".join("<th>{:s}</th>".format(cell)
+                                             for cell in cells)))
+            else:
+                parts.append("<tr>{:s}</tr>".format(
+                    "".join("<td>{:s}</td>".format(cell) for cell in cells)))
+            continue
+        if table is not None:
+            parts.append("</tbody></table>")
+            table = None
+        if line.strip():
+            parts.append("<p>{:s}</p>".format(html.escape(line,
+                                                          quote=False)))
+    if table is not None:
+        parts.append("</tbody></table>")
+    parts.append("</div>")
+    return html.escape("".join(parts), quote=False)
+
+
+class Thing:
+    """
+    A reddit thing. The World keeps the canonical copy; sessions hand out
+    snapshots bound to themselves, like praw objects that aren't refreshed.
+    """
+
+    kind = None
+
+    def __init__(self, world, id_):
+        self.world = world
+        self.id = id_
+        self.name = self.fullname = "{:s}_{:s}".format(self.kind, id_)
+        self.reddit_session = None
+
+    def bind(self, session):
+        """
+        Internal: A snapshot of the thing, acting as the given session.
+
+        Returns a Thing.
+        """
+        thing = copy.copy(self)
+        thing.reddit_session = session
+        return thing
+
+    def __repr__(self):
+        return "<{:s} {:s}>".format(type(self).__name__, self.name)
+
+
+class Redditor:
+    """
+    A user, compared by name like praw's Redditor (without fetching it).
+    """
+
+    def __init__(self, world, name):
+        self.world = world
+        self.name = name
+
+    def __eq__(self, other):
+        return (isinstance(other, Redditor)
+                and other.name.lower() == self.name.lower())
+
+    def __hash__(self):
+        return hash(self.name.lower())
+
+    def __str__(self):
+        return self.name
+
+    def get_comments(self, sort="new", limit=0, place_holder=None):
+        comments = (c for c in reversed(self.world.comments)
+                    if c.author.name == self.name)
+        return self.world.listing(
+            "user_comments", comments, limit, place_holder,
+            url="https://www.reddit.com/user/{:s}/comments/".format(
+                self.name), params={"sort": sort})
+
+
+class Submission(Thing):
+    kind = "t3"
+
+    def __init__(self, world, id_, author, title, url, created_utc,
+                 subreddit):
+        super().__init__(world, id_)
+        self.author = author
+        self.title = title
+        self.url = url
+        self.created_utc = created_utc
+        self.subreddit = subreddit
+        self.link_flair_text = None
+        self.link_flair_css_class = None
+        self.replies = []
+
+    def set_flair(self, flair_text="", flair_css_class=""):
+        self.reddit_session.require_login("set_flair")
+        self.world.call("set_link_flair")
+        self.world.set_link_flair(self.name, flair_text, flair_css_class)
+
+    def add_comment(self, text):
+        return self.reddit_session._add_comment(self.name, text)
+
+    @property
+    def comments(self):
+        self.world.call("submission")
+        return [comment.bind(self.reddit_session)
+                for comment in self.world.things[self.name].replies]
+
+    def replace_more_comments(self, limit=32, threshold=1):
+        return []
+
+
+class Comment(Thing):
+    kind = "t1"
+
+    def __init__(self, world, id_, author, body, link_id, parent_id,
+                 created_utc):
+        super().__init__(world, id_)
+        self.author = author
+        self.body = body
+        self.link_id = link_id
+        self.parent_id = parent_id
+        self.created_utc = created_utc
+        self.is_root = parent_id == link_id
+        self.distinguished = None
+        self.replies = []
+
+    @property
+    def submission(self):
+        return self.world.things[self.link_id].bind(self.reddit_session)
+
+    def reply(self, text):
+        return self.reddit_session._add_comment(self.name, text)
+
+    def distinguish(self):
+        self.reddit_session.require_login("distinguish")
+        self.world.call("distinguish")
+        self.world.things[self.name].distinguished = "moderator"
+
+
+class Message(Thing):
+    kind = "t4"
+
+    def __init__(self, world, id_, author, recipient, body, created_utc,
+                 subreddit=None):
+        super().__init__(world, id_)
+        self.author = author
+        self.dest = recipient
+        self.subreddit = subreddit
+        self.body = body
+        self.created_utc = created_utc
+        self.new = True
+        self.replies = []
+
+
+class WikiPage:
+    def __init__(self, page, content):
+        self.page = page
+        self.content_md = html.escape(content, quote=False)
+        self.content_html = render_html(content)
+
+
+class Subreddit:
+    def __init__(self, session, name):
+        self.reddit_session = session
+        self.world = session.world
+        self.display_name = name
+
+    def __str__(self):
+        return self.display_name
+
+    def get_new(self, limit=25, params=None):
+        posts = self.world.submissions
+        before = (params or {}).get("before")
+        after = (params or {}).get("after")
+        if before:
+            posts = posts[posts.index(self.world.things[before]) + 1:]
+        if after:
+            posts = posts[:posts.index(self.world.things[after])]
+        posts = (post.bind(self.reddit_session) for post in reversed(posts))
+        session = self.reddit_session
+        return self.world.listing(
+            "new", posts, limit, url=(session.config["subreddit"] % self) +
+            "new/", params=params)
+
+    def get_wiki_page(self, page):
+        self.world.call("wiki_page")
+        return WikiPage(page, self.world.wiki[page])
+
+    def get_wiki_pages(self):
+        self.world.call("wiki_pages")
+        return [WikiPage(page, "") for page in sorted(self.world.wiki)]
+
+    def edit_wiki_page(self, page, content, reason=""):
+        self.reddit_session.require_login("edit_wiki_page")
+        self.world.call("wiki_edit")
+        self.world.edit_wiki(page, content, reason)
+
+    def get_flair(self, user):
+        self.reddit_session.require_login("get_flair")
+        self.world.call("flair")
+        text, css = self.world.flair.get(str(user), (None, None))
+        return {"user": str(user), "flair_text": text,
+                "flair_css_class": css}
+
+    def get_flair_list(self, limit=None):
+        self.reddit_session.require_login("get_flair_list")
+        flairs = [{"user": user, "flair_text": text, "flair_css_class": css}
+                  for user, (text, css) in sorted(self.world.flair.items())]
+        return self.world.listing("flairlist", flairs, limit, None, page=1000)
+
+    def set_flair(self, item, flair_text="", flair_css_class=""):
+        self.reddit_session.require_login("set_flair")
+        if isinstance(item, Submission):
+            self.world.call("set_link_flair")
+            self.world.set_link_flair(item.name, flair_text, flair_css_class)
+        else:
+            self.world.call("set_flair")
+            with self.world.lock:
+                self.world.flair[str(item)] = (flair_text, flair_css_class)
+
+    def get_moderators(self):
+        self.world.call("moderators")
+        return [Redditor(self.world, name)
+                for name in sorted(self.world.moderators)]
+
+    def add_contributor(self, user):
+        self.reddit_session.require_login("add_contributor")
+        self.world.call("add_contributor")
+        with self.world.lock:
+            self.world.contributors.add(str(user))
+
+    def remove_contributor(self, user):
+        self.reddit_session.require_login("remove_contributor")
+        self.world.call("remove_contributor")
+        with self.world.lock:
+            self.world.contributors.discard(str(user))
+
+
+class Reddit:
+    """
+    A logged in (or not) praw.Reddit session.
+    """
+
+    def __init__(self, world, user_agent):
+        self.world = world
+        self.user_agent = user_agent
+        self.user = None
+        self.config = {"wiki_page": "https://www.reddit.com/r/%s/wiki/%s",
+                       "subreddit": "https://www.reddit.com/r/%s/",
+                       "info": "https://www.reddit.com/api/info/",
+                       "subreddit_comments":
+                           "https://www.reddit.com/r/%s/comments/",
+                       "flaircsv": "https://www.reddit.com/api/flaircsv/",
+                       "flairlist":
+                           "https://www.reddit.com/r/%s/api/flairlist/"}
+
+    def login(self, username, password):
+        self.world.call("login")
+        if self.world.passwords.get(username) != password:
+            raise praw.errors.InvalidUserPass("WRONG_PASSWORD",
+                                              "wrong password")
+        self.user = Redditor(self.world, username)
+
+    def require_login(self, function):
+        """
+        Internal: Fail like praw does when a call needs a logged in session.
+
+        Returns nothing.
+        """
+        if self.user is None:
+            raise praw.errors.LoginOrScopeRequired(function, "identity")
+
+    def get_subreddit(self, name):
+        return Subreddit(self, name)
+
+    def get_info(self, thing_id):
+        def fetch():
+            self.world.call("info")
+            if isinstance(thing_id, str):
+                thing = self.world.things.get(thing_id)
+                return thing.bind(self) if thing else None
+            return [self.world.things[fullname].bind(self)
+                    for fullname in thing_id if fullname in self.world.things]
+        return self.world.cached(self.config["info"], repr(thing_id), fetch)
+
+    def get_comments(self, subreddit, limit=0, place_holder=None):
+        comments = (c.bind(self) for c in reversed(self.world.comments))
+        return self.world.listing(
+            "comments", comments, limit, place_holder,
+            url=self.config["subreddit_comments"] % subreddit)
+
+    def get_redditor(self, user_name, fetch=True):
+        return Redditor(self.world, user_name)
+
+    def get_unread(self, limit=0):
+        self.require_login("get_unread")
+        unread = [message.bind(self) for message in self.world.inbox
+                  if message.new and message.dest == self.user.name]
+        return self.world.listing("unread", reversed(unread), limit,
+                                  url="https://www.reddit.com/message/unread/")
+
+    def _mark_as_read(self, thing_ids):
+        self.require_login("_mark_as_read")
+        self.world.call("read_message")
+        with self.world.lock:
+            for fullname in thing_ids:
+                self.world.things[fullname].new = False
+        self.evict("https://www.reddit.com/message/unread/")
+
+    def send_message(self, recipient, subject, message):
+        self.require_login("send_message")
+        self.world.call("compose")
+        with self.world.lock:
+            self.world.messages.append((str(recipient), subject, message))
+
+    def submit(self, subreddit, title, text=None, url=None):
+        self.require_login("submit")
+        self.world.call("submit")
+        post = self.world.submit(self.user, title, url)
+        return post.bind(self)
+
+    def _add_comment(self, thing_id, text):
+        self.require_login("_add_comment")
+        self.world.call("comment")
+        return self.world.comment(thing_id, self.user, text).bind(self)
+
+    def evict(self, urls):
+        self.world.evict(urls)
+
+    def request_json(self, url, params=None, data=None):
+        if data is not None:
+            self.require_login(url)
+        if url.endswith("/api/update_password"):
+            self.world.call("update_password")
+            if self.world.passwords.get(self.user.name) != data["curpass"]:
+                raise praw.errors.InvalidUserPass("WRONG_PASSWORD",
+                                                  "wrong password")
+            self.world.passwords[self.user.name] = data["newpass"]
+            return {}
+        if url.endswith("/api/flaircsv/"):
+            self.world.call("flaircsv")
+            results = []
+            with self.world.lock:
+                for user, text, css in csv.reader(
+                        data["flair_csv"].split("\n")):
+                    self.world.flair[user] = (text, css)
+                    results.append({"ok": True, "status": "added flair"})
+            return results
+        match = re.search(r"/wiki/revisions(?:/(.+))?$", url)
+        if match:
+            self.world.call("wiki_revisions")
+            revisions = [r for r in reversed(self.world.revisions)
+                         if match.group(1) in (None, r["page"])]
+            limit = (params or {}).get("limit", 25)
+            return {"data": {"children": revisions[:limit]}}
+        raise NotImplementedError(url)
+
+
+class Image:
+    def __init__(self, link):
+        self.link = link
+
+
+class Imgur:
+    """
+    A stand-in for pyimgur.Imgur that keeps nothing.
+    """
+
+    def __init__(self, world):
+        self.world = world
+
+    def upload_image(self, path=None, title=None, **kwargs):
+        self.world.call("imgur_upload")
+        with open(path, "rb") as image:
+            digest = sha1(image.read()).hexdigest()[:7]
+        return Image("https://i.imgur.com/{:s}.jpg".format(digest))
+
+
+class Transport:
+    """
+    A stand-in for picturegamebot.transport.Transport, handing out sessions
+    of the world and fake Street View images.
+    """
+
+    def __init__(self, world):
+        self.world = world
+
+    def reddit_session(self, user_agent):
+        return Reddit(self.world, user_agent)
+
+    def download(self, url):
+        self.world.call("streetview")
+        return sha1(url.encode("utf-8")).digest() * 512
+
+    def close(self):
+        pass
+
+
+class World:
+    """
+    The state of the fake reddit: one subreddit with its posts, comments,
+    wiki, flair, contributors and messages, and the accounts that can log
+    in.
+    """
+
+    def __init__(self, subreddit="PictureGame", clock=time.time):
+        self.subreddit = subreddit
+        self.clock = clock
+        self.calls = Counter()
+        self.lock = threading.RLock()
+        self.things = {}
+        self.submissions = []
+        self.comments = []
+        self.wiki = {}
+        self.revisions = []
+        self.flair = {}
+        self.contributors = set()
+        self.messages = []
+        self.passwords = {}
+        self.on_submit = []
+        self.cache = {}
+        self.inbox = []
+        self.moderators = set()
+        self.latency = 0
+        self._ids = count(36 ** 4)
+
+    def call(self, endpoint, number=1):
+        """
+        Public: Count requests to an endpoint, taking self.latency seconds
+          per request like a round trip would.
+
+        Returns nothing.
+        """
+        with self.lock:
+            self.calls[endpoint] += number
+        if self.latency:
+            time.sleep(self.latency * number)
+
+    def cached(self, url, key, fetch):
+        """
+        Public: Get a response through praw's cache, which keeps every GET
+          response for CACHE_SECONDS, by URL and parameters, until the URL
+          is evicted. Without a URL, nothing is cached.
+
+        url   - The URL of the request, or None.
+        key   - Anything else that makes the request different, e.g. its
+                parameters.
+        fetch - A function making the request.
+
+        Returns the response, which may be stale.
+        """
+        if url is None:
+            return fetch()
+        with self.lock:
+            hit = self.cache.get((url, key))
+            if hit is not None and self.clock() - hit[0] < CACHE_SECONDS:
+                return hit[1]
+        response = fetch()
+        with self.lock:
+            self.cache[(url, key)] = (self.clock(), response)
+        return response
+
+    def evict(self, urls):
+        """
+        Public: Drop cached responses, like praw's handler does.
+
+        urls - A URL or a list of URLs.
+
+        Returns nothing.
+        """
+        urls = [urls] if isinstance(urls, str) else list(urls)
+        with self.lock:
+            for key in [key for key in self.cache if key[0] in urls]:
+                del self.cache[key]
+
+    def listing(self, endpoint, things, limit=0, place_holder=None,
+                page=PAGE, url=None, params=None):
+        """
+        Public: Page through a listing like praw's get_content, counting a
+          request per page that is read. The first page goes through the
+          cache when the listing has a URL.
+
+        endpoint     - The name to count the requests under.
+        things       - The whole listing, in order.
+        limit        - As in praw: None for everything, 0 for one page.
+        place_holder - The id of the last thing to yield.
+        page         - How many things a request returns.
+        url          - The URL of the listing, to cache its first page.
+        params       - The parameters of the first request, for the cache.
+
+        Yields things.
+        """
+        if not limit:
+            limit = None if limit is None else 25
+        size = page if limit is None else min(limit, page)
+        things = iter(things)
+
+        def first_page():
+            self.call(endpoint)
+            return list(islice(things, size))
+
+        first = self.cached(url, (size, repr(sorted((params or {}).items()))),
+                            first_page)
+        if url is not None and first:
+            # Carry on after the (maybe stale) first page.
+            for thing in things:
+                if thing.name == first[-1].name:
+                    break
+        position = 0
+        for thing in first:
+            if limit is not None and position >= limit:
+                return
+            yield thing
+            position += 1
+            if place_holder and thing.id == place_holder:
+                return
+        if len(first) < size:
+            return
+        for thing in things:
+            if limit is not None and position >= limit:
+                return
+            if position % page == 0:
+                self.call(endpoint)
+            yield thing
+            position += 1
+            if place_holder and thing.id == place_holder:
+                return
+
+    def account(self, username, password):
+        """
+        Public: Create an account that can log in.
+
+        Returns a Redditor.
+        """
+        self.passwords[username] = password
+        return Redditor(self, username)
+
+    def submit(self, author, title, url=None, created_utc=None):
+        """
+        Public: Post a submission, as if it happened just now (or at
+          created_utc).
+
+        Returns the Submission.
+        """
+        with self.lock:
+            post = Submission(self, base36(next(self._ids)), author, title,
+                              url, created_utc or self.clock(),
+                              self.subreddit)
+            self.things[post.name] = post
+            self.submissions.append(post)
+        for hook in self.on_submit:
+            hook(post)
+        return post
+
+    def comment(self, parent, author, body, created_utc=None):
+        """
+        Public: Post a comment on a submission or a comment.
+
+        parent - The fullname of the thing to reply to.
+
+        Returns the Comment.
+        """
+        with self.lock:
+            parent = self.things[parent]
+            link_id = getattr(parent, "link_id", parent.name)
+            comment = Comment(self, base36(next(self._ids)), author, body,
+                              link_id, parent.name,
+                              created_utc or self.clock())
+            self.things[comment.name] = comment
+            self.comments.append(comment)
+            parent.replies.append(comment)
+        return comment
+
+    def message(self, author, recipient, body, subreddit=None):
+        """
+        Public: Send a private message.
+
+        author    - The Redditor sending it.
+        recipient - The name of the account it is sent to.
+        subreddit - The name of the subreddit of a comment reply, or None
+                    for a private message.
+
+        Returns the Message.
+        """
+        with self.lock:
+            message = Message(self, base36(next(self._ids)), author,
+                              recipient, body, self.clock(), subreddit)
+            self.things[message.name] = message
+            self.inbox.append(message)
+        return message
+
+    def set_link_flair(self, fullname, text, css_class):
+        with self.lock:
+            post = self.things[fullname]
+            post.link_flair_text = text
+            post.link_flair_css_class = css_class
+
+    def edit_wiki(self, page, content, reason=""):
+        with self.lock:
+            self.wiki[page] = content
+            self.revisions.append({"id": uuid.uuid4().hex, "page": page,
+                                   "reason": reason})
@@ -0,0 +1,129 @@
+"""
+Benchmark of the leaderboard index against the old dict-and-sort rendering.
+
+Usage: python -m benchmarks.leaderboard [USERS [WINS]]
+"""
+
+import sys
+import time
+import random
+
+from picturegamebot.ranking import RankIndex
+
+
+def old_to_markdown(data):
+    """
+    Internal: The old rendering, which sorts everybody and concatenates the
+      table row by row.
+
+    Returns a String.
+    """
+    table = ("Rank | Username | Rounds won | Total |\n"
+             "|:--:|:--:|:--|:--:|:--:|\n")
+    inv_map = {}
+    for username, rounds in data.items():
+        wins = len(rounds)
+        inv_map[wins] = inv_map.get(wins, [])
+        inv_map[wins].append(username)
+    for rank, wins in enumerate(sorted(inv_map, reverse=True)):
+        for username in inv_map[wins]:
+            table += "{rank} | {username} | {rounds} | {total}\n".format(
+                rank=rank + 1, username=username,
+                rounds=", ".join(data[username]), total=wins)
+    return table
+
+def old_rank(data, username):
+    """
+    Internal: What a rank lookup costs without an index.
+
+    Returns an Integer.
+    """
+    wins = len(data[username])
+    return len(set(len(r) for r in data.values() if len(r) > wins)) + 1
+
+def new_to_markdown(index, start=0, stop=None):
+    return "".join(
+        "{:d} | {:s} | {:s} | {:d}\n".format(rank, username,
+                                             ", ".join(rounds), wins)
+        for rank, username, rounds, wins in index.rows(start, stop))
+
+def generate(users, seed=0):
+    """
+    Internal: Generates a leaderboard where most users won once and a few
+      won many times.
+
+    Returns a dict of usernames to lists of rounds.
+    """
+    rand = random.Random(seed)
+    data, roundno = {}, 0
+    for number in range(users):
+        wins = min(int(rand.paretovariate(1.5)), 400)
+        data["user{:d}".format(number)] = [
+            str(roundno + i) for i in range(wins)]
+        roundno += wins
+    return data, roundno
+
+def timed(label, function, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    seconds = (time.perf_counter() - start) / repeat
+    print("{:40s} {:10.3f} ms".format(label, seconds * 1000))
+
+def main(users=100000, wins=100):
+    data, roundno = generate(users)
+    index = RankIndex.from_rows(data.items())
+    names = list(data)
+    rand = random.Random(1)
+    winners = [rand.choice(names) for _ in range(wins)]
+    print("{:d} users, {:d} rounds, {:d} distinct win counts".format(
+        len(index), roundno, len(index.levels)))
+
+    def old_wins():
+        for number, username in enumerate(winners):
+            data[username].append(str(roundno + number))
+            data[username].remove(str(roundno + number))
+
+    def new_wins():
+        for number, username in enumerate(winners):
+            index.add(username, str(roundno + number))
+            index.remove(username, str(roundno + number))
+
+    top = max(names, key=lambda username: len(data[username]))
+    first = data[top][0]
+
+    def old_discredits():
+        for _ in range(wins):
+            data[top].remove(first)
+            data[top].insert(0, first)
+
+    def new_discredits():
+        for _ in range(wins):
+            index.remove(top, first)
+            index.add(top, first)
+
+    timed("old: {:d} add+remove".format(wins), old_wins)
+    timed("new: {:d} add+remove".format(wins), new_wins)
+    # The old code had to scan everybody for a rank after a change.
+    timed("old: {:d} add+rank".format(wins // 10), lambda: [
+        (data[username].append(str(roundno + number)),
+         old_rank(data, username), data[username].pop())
+        for number, username in enumerate(winners[:wins // 10])])
+    timed("new: {:d} add+rank".format(wins // 10), lambda: [
+        (index.add(username, str(roundno + number)), index.rank(username),
+         index.remove(username, str(roundno + number)))
+        for number, username in enumerate(winners[:wins // 10])])
+    timed("old: {:d} remove+add, {:d} wins".format(wins, len(data[top])),
+          old_discredits)
+    timed("new: {:d} remove+add, {:d} wins".format(wins, len(data[top])),
+          new_discredits)
+    timed("old: rank of a user", lambda: old_rank(data, winners[0]), 10)
+    timed("new: rank of a user", lambda: index.rank(winners[0]), 10)
+    timed("old: full render", lambda: old_to_markdown(data), 3)
+    timed("new: full render", lambda: new_to_markdown(index), 3)
+    timed("new: top 100", lambda: index.top(100), 10)
+    timed("new: render rows 50000-50100",
+          lambda: new_to_markdown(index, 50000, 50100), 10)
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
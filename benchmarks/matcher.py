@@ -0,0 +1,109 @@
+"""
+Benchmark of the bot challenge answer matching on a synthetic thread.
+
+Usage: python -m benchmarks.matcher [COMMENTS [REFRESHES]]
+"""
+
+import sys
+import time
+import random
+
+from picturegamebot.matcher import AnswerMatcher
+
+WORDS = ("is it the in new york london paris square tower bridge street "
+         "museum park hotel church palace station market cathedral times "
+         "white house stanley danbury i think maybe looks like").split()
+
+
+def synthetic_thread(size, seed=0):
+    """
+    Internal: Generates comment bodies that look like guesses.
+
+    size - The number of comments.
+    seed - The random seed, so that runs are comparable.
+
+    Returns a list of Strings.
+    """
+    rand = random.Random(seed)
+    bodies = [" ".join(rand.choice(WORDS) for _ in range(rand.randint(3, 25)))
+              for _ in range(size)]
+    for i in rand.sample(range(size), size // 100):
+        bodies[i] += rand.choice([" Trafalgar Square!", " trafalgar squre?",
+                                  " Tràfalgar sq."])
+    return bodies
+
+def naive(aliases, bodies):
+    """
+    Internal: The old check, extended to several aliases.
+
+    Returns the number of matching comments.
+    """
+    return sum(1 for body in bodies
+               if any(alias.lower() in body.lower() for alias in aliases))
+
+def compiled(matcher, bodies):
+    """
+    Internal: The compiled matcher.
+
+    Returns the number of matching comments.
+    """
+    return sum(1 for body in bodies if matcher.match(body))
+
+def rescanned(aliases, bodies, refreshes):
+    """
+    Internal: The old flow, where the whole thread is checked again on every
+      refresh while it grows.
+
+    Returns the number of comment checks.
+    """
+    checks = 0
+    for refresh in range(1, refreshes + 1):
+        seen = bodies[:len(bodies) * refresh // refreshes]
+        naive(aliases, seen)
+        checks += len(seen)
+    return checks
+
+def streamed(matcher, bodies, refreshes):
+    """
+    Internal: The new flow, where every refresh only checks new comments.
+
+    Returns the number of comment checks.
+    """
+    checks = done = 0
+    for refresh in range(1, refreshes + 1):
+        upto = len(bodies) * refresh // refreshes
+        compiled(matcher, bodies[done:upto])
+        checks += upto - done
+        done = upto
+    return checks
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def main(size=10000, refreshes=360):
+    aliases = ["Trafalgar Square", "Nelson's Column", "Trafalgar Sq"]
+    bodies = synthetic_thread(size)
+    print("{:d} comments, {:d} aliases".format(size, len(aliases)))
+    result, seconds = timed(naive, aliases, bodies)
+    print("naive substring:     {:7.1f} ms ({:d} matches)".format(
+        seconds * 1000, result))
+    for tolerance in (0, 1):
+        matcher, build = timed(AnswerMatcher, aliases, tolerance)
+        result, seconds = timed(compiled, matcher, bodies)
+        print("matcher, {:d} typo(s): {:7.1f} ms ({:d} matches, built in "
+              "{:.2f} ms)".format(tolerance, seconds * 1000, result,
+                                  build * 1000))
+    print("\nThread growing over {:d} refreshes (90 minutes at 15s):".format(
+        refreshes))
+    result, seconds = timed(rescanned, aliases, bodies, refreshes)
+    print("rescan every refresh: {:8.1f} ms ({:d} checks)".format(
+        seconds * 1000, result))
+    matcher = AnswerMatcher(aliases, 1)
+    result, seconds = timed(streamed, matcher, bodies, refreshes)
+    print("new comments only:    {:8.1f} ms ({:d} checks)".format(
+        seconds * 1000, result))
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,79 @@
+"""
+Startup benchmark of PictureGameBot against the offline fake reddit, with
+every request taking a fixed round trip. Reports how long the constructor
+takes and how long until the first pass is done, next to what the same
+requests would take one after the other.
+
+Usage: python -m benchmarks.startup [--latency SECONDS] [--players N]
+                                    [--runs N]
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+from benchmarks import fakereddit
+from benchmarks.endtoend import BACKGROUND, BOT, make_world, workspace
+from picturegamebot.bot import PictureGameBot
+
+
+def start(latency, players):
+    """
+    Internal: Start a bot on a fresh world and do its first pass.
+
+    latency - Seconds each request takes.
+    players - The number of users on the leaderboard.
+
+    Returns a dict of results.
+    """
+    world = make_world(players)
+    world.latency = latency
+    begin = time.perf_counter()
+    bot = PictureGameBot(gamebot=BOT, transport=fakereddit.Transport(world),
+                         imgur=fakereddit.Imgur(world))
+    ready = time.perf_counter() - begin
+    bot.step()
+    first = time.perf_counter() - begin
+    # The leaderboard is only needed by the first win, so it may still be
+    # loading in the background.
+    bot.leaderboard.rounds(BOT[0])
+    warm = time.perf_counter() - begin
+    calls = sum(number for endpoint, number in world.calls.items()
+                if endpoint not in BACKGROUND)
+    return {"ready": ready, "first_pass": first, "warm": warm,
+            "calls": calls, "serial": calls * latency}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--latency", type=float, default=0.1,
+                        help="seconds per request")
+    parser.add_argument("--players", type=int, default=5000,
+                        help="users on the leaderboard")
+    parser.add_argument("--runs", type=int, default=3)
+    options = parser.parse_args()
+
+    for name in ("REDDIT_USERNAME", "REDDIT_PASSWORD", "METRICS_PORT"):
+        os.environ.pop(name, None)
+    home = os.getcwd()
+    root = tempfile.mkdtemp(prefix="picturegame-")
+    results = []
+    try:
+        for run in range(options.runs):
+            os.chdir(workspace(os.path.join(root, str(run))))
+            results.append(start(options.latency, options.players))
+            os.chdir(home)
+    finally:
+        os.chdir(home)
+        shutil.rmtree(root, ignore_errors=True)
+
+    print("\n{:>8s} {:>11s} {:>8s} {:>6s} {:>11s}".format(
+        "ready s", "1st pass s", "warm s", "calls", "serial s"))
+    for result in results:
+        print("{:>8.2f} {:>11.2f} {:>8.2f} {:>6d} {:>11.2f}".format(
+            result["ready"], result["first_pass"], result["warm"],
+            result["calls"], result["serial"]))
+
+if __name__ == "__main__":
+    main()
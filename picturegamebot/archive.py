@@ -0,0 +1,132 @@
+"""
+Archive
+"""
+
+import sqlite3
+import threading
+
+# Statuses of a round that won't change anymore. A round flaired as over
+# without a winner found isn't one of them, nor is one whose comments
+# couldn't all be read.
+FINAL = ("solved", "abandoned", "dead")
+
+
+class Archive:
+    """
+    A local record of past rounds, in a small SQLite database: who posted
+    each round and when, its flair, who won it and when the OP marked the
+    answer, or whether it was abandoned. Filled in by
+    picturegamebot.backfill, and enough to rebuild the leaderboard and the
+    flairs without reading the subreddit again.
+    """
+
+    def __init__(self, path="tmp/archive.sqlite3"):
+        """
+        Public: Open (or create) the archive.
+
+        path - The location of the database.
+
+        Returns an instance of Archive.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS rounds "
+                         "(post TEXT PRIMARY KEY, number INTEGER NOT NULL, "
+                         "title TEXT, author TEXT, created REAL, flair TEXT, "
+                         "status TEXT NOT NULL, winner TEXT, comment TEXT, "
+                         "solved REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS rounds_number "
+                         "ON rounds (number)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS rounds_winner "
+                         "ON rounds (winner)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS checkpoints "
+                         "(name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def store(self, rounds):
+        """
+        Public: Save rounds, replacing what was known about them before, in
+          one transaction.
+
+        rounds - A list of dicts with the columns of the rounds table.
+
+        Returns nothing.
+        """
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO rounds (post, number, title, "
+                    "author, created, flair, status, winner, comment, "
+                    "solved) VALUES (:post, :number, :title, :author, "
+                    ":created, :flair, :status, :winner, :comment, :solved)",
+                    rounds)
+
+    def is_final(self, post):
+        """
+        Public: Says whether a round was archived in a state that won't
+          change anymore, so it doesn't need to be looked at again.
+
+        post - The fullname of the round's submission.
+
+        Returns a Boolean.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT status FROM rounds WHERE post = ?",
+                                   (post,)).fetchone()
+        return row is not None and row[0] in FINAL
+
+    def checkpoint(self, name, value=False):
+        """
+        Public: Get or set a checkpoint, e.g. where a crawl stopped.
+
+        name  - The name of the checkpoint.
+        value - A String to set it to, or None to delete it. Leave it out
+                to get the checkpoint.
+
+        Returns the checkpoint's String, or None.
+        """
+        with self._lock:
+            if value is False:
+                row = self._db.execute(
+                    "SELECT value FROM checkpoints WHERE name = ?",
+                    (name,)).fetchone()
+                return row and row[0]
+            if value is None:
+                self._db.execute("DELETE FROM checkpoints WHERE name = ?",
+                                 (name,))
+            else:
+                self._db.execute("INSERT OR REPLACE INTO checkpoints "
+                                 "(name, value) VALUES (?, ?)", (name, value))
+
+    def wins(self):
+        """
+        Public: Get the rounds won by everybody, the way the leaderboard
+          keeps them. A round that was posted twice counts once.
+
+        Returns a list of (username, list of rounds as Strings) tuples, the
+          rounds in order.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT winner, number FROM rounds WHERE winner IS NOT NULL "
+                "GROUP BY winner, number ORDER BY number").fetchall()
+        wins = {}
+        for winner, number in rows:
+            wins.setdefault(winner, []).append(str(number))
+        return list(wins.items())
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM rounds").fetchone()[0]
+
+    def close(self):
+        """
+        Public: Close the database.
+
+        Returns nothing.
+        """
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,220 @@
+"""
+Backfill
+
+Crawls the subreddit's past rounds into the local archive, and adds the wins
+it finds to the leaderboard and the flairs.
+
+Usage: python -m picturegamebot.backfill [--subreddit NAME] [--workers N]
+                                         [--archive FILE] [--rebuild]
+                                         [--dry-run]
+"""
+
+import os
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import praw
+
+from picturegamebot.archive import Archive
+from picturegamebot.bot import PictureGameBot
+from picturegamebot.comments import CommentIndex, ParentCache, find_winner
+from picturegamebot.flair import FlairSync
+from picturegamebot.leaderboard import Leaderboard
+from picturegamebot.metrics import timed
+from picturegamebot.rounds import ROUND_TITLE
+from picturegamebot.transport import BACKGROUND, Transport, priority
+
+STATUSES = (("ABANDONED", "abandoned"), ("DEAD ROUND", "dead"),
+            ("ROUND OVER", "over"))
+
+
+class Backfill:
+    """
+    Reads the subreddit's submissions from the newest to the oldest, and
+    archives every round with its winner. The comment trees of a few rounds
+    are fetched at the same time, behind the bot's own requests, and the
+    position in the listing is saved as the rounds are archived, so that an
+    interrupted crawl carries on where it stopped. Once a crawl is done, the
+    next ones stop at the first round that was already archived for good.
+    """
+
+    def __init__(self, session, subreddit, archive, workers=4, more=None):
+        """
+        Public: Set up a crawl.
+
+        session   - A praw.Reddit session.
+        subreddit - The name of the subreddit.
+        archive   - The picturegamebot.archive.Archive to fill.
+        workers   - How many rounds to look at concurrently.
+        more      - How many "load more comments" to expand per round, or
+                    None for all of them. Rounds with some left over are
+                    looked at again by the next crawl.
+
+        Returns an instance of Backfill.
+        """
+        self.session = session
+        self.subreddit = session.get_subreddit(subreddit)
+        self.archive = archive
+        self.workers = workers
+        self.more = more
+
+    def _listing(self):
+        """
+        Private: Iterate over the submissions left to look at, from where
+          the last crawl stopped.
+
+        Yields praw.objects.Submission.
+        """
+        after = self.archive.checkpoint("after")
+        complete = self.archive.checkpoint("complete")
+        params = {"after": after} if after else None
+        for post in self.subreddit.get_new(limit=None, params=params):
+            if self.archive.is_final(post.fullname):
+                if complete:
+                    return
+                continue
+            yield post
+
+    @timed
+    def examine(self, post):
+        """
+        Public: Work out how a round went, from its flair and its comments.
+
+        post - The praw.objects.Submission of the round.
+
+        Returns a dict of the columns of the archive.
+        """
+        with priority(BACKGROUND):
+            leftovers = post.replace_more_comments(limit=self.more,
+                                                   threshold=0)
+            comments = praw.helpers.flatten_tree(post.comments)
+            index = CommentIndex(post)
+            index.ingest(sorted(comments, key=lambda c: c.created_utc))
+            winner = find_winner(index, ParentCache(self.session))
+        flair = post.link_flair_text or ""
+        status = "solved" if winner else next(
+            (status for text, status in STATUSES if text in flair.upper()),
+            "unsolved")
+        if leftovers:
+            # The winner may be in the comments that weren't read.
+            status = "partial"
+        correct = index.correct[winner.name] if winner else None
+        return {"post": post.fullname,
+                "number": int(ROUND_TITLE.search(post.title).group(1)),
+                "title": post.title,
+                "author": post.author.name if post.author else None,
+                "created": post.created_utc, "flair": flair,
+                "status": status,
+                "winner": winner.author.name if winner else None,
+                "comment": winner.name if winner else None,
+                "solved": correct.created_utc if correct else None}
+
+    def _save(self, post, future):
+        """
+        Private: Archive a round once it is examined, and move the checkpoint
+          past it.
+
+        post   - The praw.objects.Submission.
+        future - The Future of its record, or None if it isn't a round.
+
+        Returns nothing.
+        """
+        if future is not None:
+            self.archive.store([future.result()])
+        self.archive.checkpoint("after", post.fullname)
+
+    def run(self):
+        """
+        Public: Crawl until the end of the listing, or the rounds that are
+          already archived. Rounds are archived in the order of the listing,
+          so that the checkpoint never skips one.
+
+        Returns the number of rounds archived.
+        """
+        archived = 0
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for post in self._listing():
+                future = None
+                if ROUND_TITLE.search(post.title):
+                    future = executor.submit(self.examine, post)
+                    archived += 1
+                pending.append((post, future))
+                while len(pending) > self.workers * 2:
+                    self._save(*pending.popleft())
+            while pending:
+                self._save(*pending.popleft())
+        self.archive.checkpoint("after", None)
+        self.archive.checkpoint("complete", "1")
+        return archived
+
+
+def rebuild(subreddit, archive, dry_run=False):
+    """
+    Public: Add the wins in the archive that the leaderboard is missing, and
+      fix the flairs of the users who got them. The archive only goes as far
+      back as reddit's listings, so nothing is taken off the leaderboard,
+      and a round it credits to someone else is reported and left alone.
+
+    subreddit - A praw.objects.Subreddit, with a moderator's session.
+    archive   - The picturegamebot.archive.Archive.
+    dry_run   - Whether to only print what would change.
+
+    Returns nothing.
+    """
+    leaderboard = Leaderboard(subreddit, window=0,
+                              shard_size=PictureGameBot.shard_size)
+    added, conflicts = leaderboard.merge(
+        archive.wins(), "Added wins from the round archive.", dry_run)
+    for roundno, owner, winner in conflicts:
+        print("Round {:s}: the archive says {:s} won it, the leaderboard "
+              "says {:s}. Kept {:s}.".format(roundno, winner, owner, owner))
+    for username, rounds in sorted(added.items()):
+        print("+ {:s}: {:s}".format(username, ", ".join(rounds)))
+    wins = dict((username, leaderboard.rounds(username) +
+                 (rounds if dry_run else []))
+                for username, rounds in added.items())
+    flairs = FlairSync(subreddit)
+    if dry_run:
+        for username, current, text in flairs.plan(wins):
+            print("{:s}: {!r} -> {!r}".format(username, current, text))
+        print("Dry run, nothing was changed.")
+        return
+    print("Leaderboard updated, {:d} users got wins.".format(len(added)))
+    print("Flairs reconciled, {:d} changed.".format(flairs.reconcile(wins)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--subreddit", default="PictureGame")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="rounds to fetch at the same time")
+    parser.add_argument("--archive", default="tmp/archive.sqlite3")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="add the archive's wins to the leaderboard and "
+                             "the flairs instead of crawling")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="with --rebuild, only print what would change")
+    options = parser.parse_args()
+
+    transport = Transport()
+    session = transport.reddit_session("{:s}, v{:s}".format(
+        PictureGameBot.user_agent, PictureGameBot.version))
+    session.login(os.environ.get("REDDIT_USERNAME"),
+                  os.environ.get("REDDIT_PASSWORD"))
+    archive = Archive(options.archive)
+    try:
+        if options.rebuild:
+            rebuild(session.get_subreddit(options.subreddit), archive,
+                    options.dry_run)
+        else:
+            count = Backfill(session, options.subreddit, archive,
+                             workers=options.workers).run()
+            print("Archived {:d} rounds, {:d} in total.".format(
+                count, len(archive)))
+    finally:
+        archive.close()
+        transport.close()
+
+if __name__ == "__main__":
+    main()
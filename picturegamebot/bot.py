@@ -14,18 +14,36 @@ Requirements:
 import os
 import re
 import sys
+import atexit
 import praw
 import time
+import signal
 import base64
 import pyimgur
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from random import choice as sample
-from urllib.request import urlretrieve
 
 import warnings
 warnings.filterwarnings("ignore", category=ResourceWarning)
 
+from picturegamebot.cadence import Cadence
+from picturegamebot.challenges import ChallengePool, load_challenges
+from picturegamebot.commands import Commands
+from picturegamebot.comments import (CommentIndex, CommentStream, ParentCache,
+                                     find_winner, same_author)
+from picturegamebot.flair import FlairSync
+from picturegamebot.imagecache import ImageCache
 from picturegamebot.leaderboard import Leaderboard
+from picturegamebot.matcher import AnswerMatcher
+from picturegamebot.metrics import REGISTRY, Profiler, timed
+from picturegamebot.outbox import Outbox
+from picturegamebot.rounds import RoundTracker
+from picturegamebot.schedule import Scheduler
+from picturegamebot.state import State
+from picturegamebot.transport import BACKGROUND, CRITICAL, Transport, priority
 
 
 def generate_password():
@@ -55,7 +73,43 @@ def minutes_passed(thing, minutes):
     Returns a Boolean.
     """
     if thing:
-        return time.time() > (thing.created_utc + (minutes*60))
+        return time.time() > deadline(thing, minutes)
+
+def deadline(thing, minutes):
+    """
+    Internal: Returns the time at which said minutes will have passed since
+      the creation of said thing.
+
+    thing   - An object with a 'created_utc' attribute.
+    minutes - Number of minutes to have passed.
+
+    Returns a UNIX time.
+    """
+    return thing.created_utc + (minutes*60)
+
+def unsolved(post):
+    """
+    Internal: Says whether a round is still open, from its flair: it has
+      none yet, or it is flaired as unsolved.
+
+    post - A praw.objects.Submission.
+
+    Returns a Boolean.
+    """
+    link_flair = post.link_flair_text
+    return bool(link_flair is None
+                or link_flair == ""
+                or re.search(link_flair, "UNSOLVED", re.IGNORECASE))
+
+def exit_on_sigterm():
+    """
+    Internal: Exit normally on SIGTERM, which is how Heroku stops a dyno, so
+      that the atexit handlers still publish the leaderboard and close the
+      databases. Only works from the main thread.
+
+    Returns nothing.
+    """
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
 
 class PictureGameBot:
@@ -64,34 +118,187 @@ class PictureGameBot:
     """
     version = "1.0"
     user_agent = "/r/PictureGame Bot"
+    poll_floor = 5        # Least seconds between looking for an answer.
+    poll_ceiling = 120    # Most seconds between looking for an answer.
+    # Typos accepted in a bot challenge answer. Even one lets wrong answers
+    # in, e.g. "Whitehorse" for "Whitehouse", so answers must be exact.
+    answer_tolerance = 0
+    pool_size = 3         # Challenges to keep uploaded ahead of time.
+    shard_size = None     # Rows per leaderboard wiki page. (optional)
+    metrics_path = "tmp/metrics.prom"  # Rewritten after every pass.
 
     def __init__(self, gamebot=(None, None), imgurid=None,
-                 subreddit="PictureGame"):
+                 subreddit="PictureGame", transport=None, imgur=None,
+                 host=None):
         """
-        Public: Logs into the bot and the player account. Sets up imgur
-          access.
+        Public: Logs into the bot account and reads the player account's
+          credentials, while the rest is set up. Sets up imgur access. The
+          player account logs in when it is first used, and the leaderboard
+          is loaded in the background.
 
         gamebot   - A tuple of username and password for the bot account.
         imgurid   - The Client ID used to log into Imgur.
         subreddit - The subreddit to listen on.
+        transport - The picturegamebot.transport.Transport to make requests
+                    with. (optional)
+        imgur     - The pyimgur.Imgur client to upload challenges with.
+                    (optional, made from imgurid)
+        host      - A picturegamebot.host.GameHost running several games in
+                    this process. Its bot session, transport, Imgur client
+                    and challenge pool are used instead of new ones, and
+                    the game keeps its state in tmp/<subreddit>/.
+                    (optional)
 
         Returns an instance of PictureGameBot.
         """
-        self.gamebot = (os.environ.get("REDDIT_USERNAME", gamebot[0]),
-                        os.environ.get("REDDIT_PASSWORD", gamebot[1]))
-        self.r_gamebot = praw.Reddit("{:s}, v{:s}".format(self.user_agent,
-                                                          self.version))
-        self.r_gamebot.login(self.gamebot[0], self.gamebot[1])
+        self.host = host
+        if host is None:
+            self.gamebot = (os.environ.get("REDDIT_USERNAME", gamebot[0]),
+                            os.environ.get("REDDIT_PASSWORD", gamebot[1]))
+            self.transport = transport or Transport()
+            atexit.register(self.transport.close)
+            self.r_gamebot = self.transport.reddit_session(
+                "{:s}, v{:s}".format(self.user_agent, self.version))
+            directory = "tmp"
+        else:
+            self.gamebot = host.gamebot
+            self.transport = host.transport
+            self.r_gamebot = host.r_gamebot
+            directory = os.path.join("tmp", subreddit)
+            os.makedirs(directory, exist_ok=True)
+
+        self.state = State(os.path.join(directory, "state.sqlite3"))
+        atexit.register(self.state.close)
 
         self.subreddit = self.r_gamebot.get_subreddit(subreddit)
+        self.leaderboard = Leaderboard(self.subreddit,
+                                       shard_size=self.shard_size,
+                                       state=self.state)
+        atexit.register(self.leaderboard.flush)
+
+        # Logging in and reading the accounts page take a few round trips,
+        # so the local setup is done in the meantime. The player account
+        # only logs in when it is first needed.
+        connecting = ThreadPoolExecutor(max_workers=1)
+        credentials = connecting.submit(self.connect, host is None)
+        connecting.shutdown(wait=False)
+        self._r_player = None
+        self._player_lock = threading.Lock()
+
+        if host is None:
+            self.imgur = imgur or pyimgur.Imgur(os.environ.get("IMGUR_ID",
+                                                               imgurid))
+            self.images = ImageCache(fetch=self.transport.download)
+            self.pool = ChallengePool(self.imgur, load_challenges(),
+                                      self.images, size=self.pool_size)
+            self.pool.start()
+        else:
+            self.imgur = host.imgur
+            self.images = host.images
+            self.pool = host.pool
+
+        self.flairs = FlairSync(self.subreddit)
+
+        self.outbox = Outbox({
+            "reply": self.send_reply,
+            "increment_flair": self.increment_flair,
+            "update_flair": self.update_flair,
+            "resync_flairs": self.resync_flairs,
+            "link_flair": self.set_link_flair,
+            "send_message": self.r_gamebot.send_message,
+            "add_contributor": self.subreddit.add_contributor,
+            "remove_contributor": self.subreddit.remove_contributor,
+        }, path=os.path.join(directory, "outbox.jsonl"), state=self.state)
+
+        self.stream = CommentStream(self.r_gamebot, self.subreddit)
+        self.index = None
+        self.parents = ParentCache(self.r_gamebot)
+
+        self.cadence = Cadence(self.poll_floor, self.poll_ceiling)
+        self.rounds = RoundTracker(self.subreddit)
+        self.scheduler = Scheduler(state=self.state)
+        self.round = None         # The round the deadlines belong to.
+        self.challenge = None     # The bot's challenge, while it runs.
+        self.commands = Commands(self)
+        self.relogin = False      # Whether the player password was wrong.
+
+        self.metrics = REGISTRY
+        if host is None:
+            if os.environ.get("METRICS_PORT"):
+                self.metrics.serve(int(os.environ["METRICS_PORT"]))
+            Profiler().install()
+
+        self.player = credentials.result()
+        # The journaled actions need the bot to be logged in.
+        self.outbox.start()
+
+    def connect(self, login=True):
+        """
+        Internal: Log the bot in, start loading the leaderboard in the
+          background, and read the player account's credentials.
 
-        self.player = self.get_player_credentials()
-        self.r_player = praw.Reddit("/r/PictureGame Account")
-        self.r_player.login(self.player[0], self.player[1])
+        login - Whether the bot's session still has to log in.
+
+        Returns a tuple of the player account's username and password.
+        """
+        if login:
+            self.r_gamebot.login(self.gamebot[0], self.gamebot[1])
+        self.leaderboard.warm_up()
+        return self.get_player_credentials()
+
+    @property
+    def r_player(self):
+        """
+        Public: The reddit session of the player account, logged in the
+          first time it is used.
+
+        Returns a praw.Reddit.
+        """
+        with self._player_lock:
+            if self._r_player is None:
+                if self.host is None:
+                    session = self.transport.reddit_session(
+                        "/r/PictureGame Account")
+                    session.login(self.player[0], self.player[1])
+                else:
+                    session = self.host.player_session(*self.player)
+                self._r_player = session
+            return self._r_player
 
-        self.imgur = pyimgur.Imgur(os.environ.get("IMGUR_ID", imgurid))
+    @property
+    def player(self):
+        """
+        Public: The player account's username and password. When hosted,
+          the password is the one the host keeps with the account's shared
+          session, so that a reset by another game is seen by this one.
+
+        Returns a tuple of username/password.
+        """
+        if self.host is not None:
+            password = self.host.player_password(self._player[0])
+            if password is not None:
+                return (self._player[0], password)
+        return self._player
+
+    @player.setter
+    def player(self, credentials):
+        self._player = tuple(credentials)
+        if self.host is not None:
+            self.host.set_player_password(*self._player)
+
+    @property
+    def current_op(self):
+        """
+        Public: Who owns the account, by name, so that they can be removed
+          as a contributor when someone else wins. Kept across restarts.
+
+        Returns a String, or None.
+        """
+        return self.state.get("current_op")
 
-        self.leaderboard = Leaderboard(self.subreddit)
+    @current_op.setter
+    def current_op(self, name):
+        self.state.set("current_op", name)
 
     def get_player_credentials(self, page="accounts"):
         """
@@ -124,15 +331,16 @@ class PictureGameBot:
             page, new_content, 
             reason="Password Update")
 
+    @timed
     def latest_round(self):
         """
         Internal: Gets the top post in a subreddit that starts with "[Round".
+          The round is tracked between passes, so that only newer posts and
+          the round itself are fetched.
 
         Returns a praw.objects.Submission.
         """
-        new = self.subreddit.get_new()
-        return next(post for post in new if re.search(r"^\[Round", post.title,
-                                                      re.IGNORECASE))
+        return self.rounds.latest()
 
     def reset_password(self, password=None):
         """
@@ -156,64 +364,105 @@ class PictureGameBot:
 
     def increment_flair(self, user, curround):
         """
-        Internal: Add the current win to the player's flair. If the player
-          has more than 7 wins, sets the flair to "X wins", else adds the
-          current round number to the flair.
+        Internal: Add the current win to the player's flair. Used by the
+          outbox. The flair is worked out from the player's rounds on the
+          leaderboard: up to 7 wins are listed as "Round 1234, 2345", more
+          are shown as "8 wins". See picturegamebot.flair.
 
         NOTE: Any additional flair (e.g. "Fair Play Award" or "Official
           PictureGame Critic") will only work with the wins format. For
           example, the mods must change "Round 1234, 2345" to "2 wins" before
           adding a "Difficult Question Asker" to the end of it.
 
-        user     - A praw.objects.Redditor.
+        user     - A praw.objects.Redditor or a username.
         curround - The round number that the user just won.
 
         Returns nothing.
         """
-        flair = self.subreddit.get_flair(user)
-        if flair is not None:
-            text = flair["flair_text"]
-            if text == "" or text is None:
-                self.subreddit.set_flair(user, "Round {:d}".format(curround),
-                                         "winner")
-            elif re.search(r"\d+ wins", text):
-                repl = re.sub(
-                    r"(\d+) wins",
-                    lambda m: "{:d} wins".format(int(m.group(1)) + 1),
-                    text)
-                self.subreddit.set_flair(user, repl, "winner")
-            elif re.search(r"^Round", text):
-                rounds = len(re.findall(r"(\d+)", text))
-                if rounds >= 7:
-                    self.subreddit.set_flair(user,
-                                             "{:d} wins".format(rounds + 1),
-                                             "winner")
-                else:
-                    self.subreddit.set_flair(
-                        user,
-                        "{:s}, {:d}".format(text, curround), "winner")
+        name = str(user)
+        rounds = self.leaderboard.rounds(name)
+        if str(curround) not in rounds:
+            # The win may not be on the leaderboard yet.
+            rounds.append(str(curround))
+        self.flairs.update(name, rounds)
+
+    def update_flair(self, user):
+        """
+        Internal: Make a player's flair match their rounds on the
+          leaderboard, e.g. after a win was taken away. Used by the outbox.
+
+        user - A praw.objects.Redditor or a username.
+
+        Returns nothing.
+        """
+        name = str(user)
+        self.flairs.update(name, self.leaderboard.rounds(name))
+
+    def resync_flairs(self):
+        """
+        Public: Make every flair in the subreddit match the leaderboard, in
+          bulk. This overwrites the winners' flairs the mods edited by hand,
+          so it is only done when a moderator asks for it with !resync.
+
+        Returns the number of flairs changed.
+        """
+        changed = self.flairs.resync(self.leaderboard.everyone())
+        print("Flairs resynced, {:d} changed.".format(changed))
+        return changed
+
+    def discredit(self, user, roundno):
+        """
+        Public: Take a win away from a player, on the leaderboard and in
+          their flair.
+
+        user    - A praw.objects.Redditor.
+        roundno - The number of the round to take away.
+
+        Returns nothing.
+        """
+        self.leaderboard.remove(user, roundno, publish=True)
+        self.outbox.put("update_flair", user.name, key=user.name,
+                        level=BACKGROUND)
+
+    def comment_index(self, post):
+        """
+        Internal: Get the CommentIndex of the given round. Whenever the
+          round changes, a new index catches up on the OP's comments and is
+          then fed by the comment stream.
 
+        post - A praw.objects.Submission object.
+
+        Returns a picturegamebot.comments.CommentIndex.
+        """
+        if self.index is None or self.index.post.id != post.id:
+            if self.index is not None:
+                self.stream.unregister(self.index.post)
+            self.index = CommentIndex(post)
+            self.index.refresh()
+            self.stream.register(post, self.index.ingest)
+        return self.index
+
+    @timed
     def winner_comment(self, post):
         """
         Internal: Get the comment that gave the correct answer (because it
-          was replied with "+correct" by the r_player account).
+          was replied with "+correct" by the r_player account). Only the
+          comments that are new since the last call are fetched, and the
+          answers are looked up together. The new comments set the pace of
+          the next polls.
 
         post - A praw.objects.Submission object.
 
         Returns a praw.objects.Comment.
         """
-        post.replace_more_comments(limit=None)
-        comments = praw.helpers.flatten_tree(post.comments)
-        for comment in comments:
-            if (isinstance(comment, praw.objects.Comment)
-                    and comment.author == post.author
-                    and "+correct" in comment.body
-                    and not comment.is_root):
-                parent = self.r_gamebot.get_info(thing_id=comment.parent_id)
-                if (parent.author is not None
-                        and parent.author != post.author):
-                    return parent
-
+        index = self.comment_index(post)
+        fresh = [comment for comment in self.stream.poll()
+                 if comment.link_id == post.fullname]
+        self.cadence.record(len(fresh), hot=any(same_author(comment, post)
+                                                for comment in fresh))
+        return find_winner(index, self.parents)
+
+    @timed
     def already_replied(self, comment):
         """
         Internal: Says whether the given comment already has a reply from the
@@ -228,12 +477,28 @@ class PictureGameBot:
             if reply.author == self.r_gamebot.user:
                 return True
 
+    def processed(self, comment):
+        """
+        Internal: Says whether the win of the given comment was already
+          handed out, from the local state. The replies are only scanned
+          when there is no state yet, e.g. on the first run with it.
+
+        comment - The winning comment.
+
+        Returns a Boolean.
+        """
+        if self.outbox.was_sent("win:" + comment.name):
+            return True
+        if self.state.new:
+            return bool(self.already_replied(comment))
+        return False
+
     def warn_nopost(self, op_=None):
         """
         Internal: Warn the account and the op, if possible, that the account
           will be reset if he doesn't create a post in 30 minutes.
 
-        op_ - An optional other person who holds the account.
+        op_ - An optional other person who holds the account, by name.
 
         Returns nothing.
         """
@@ -243,16 +508,19 @@ class PictureGameBot:
             "last round. Please upload a post in the next 15 minutes, or "
             "else your account will be reset."
         )
+        dedupe = "nopost:{!s}".format(self.round and self.round.id)
         if op_:
-            self.r_gamebot.send_message(op_, subject, text)
-        self.r_gamebot.send_message(self.r_player.user, subject, text)
+            self.outbox.put("send_message", op_, subject, text, key=op_,
+                            dedupe=dedupe + ":op", level=BACKGROUND)
+        self.outbox.put("send_message", self.player[0], subject, text,
+                        key=self.player[0], dedupe=dedupe, level=BACKGROUND)
 
     def warn_noanswer(self, op_=None):
         """
         Internal: Warn the account and the op, if possible, that the account
           will be reset if his question isn't answered in 30 minutes.
 
-        op_ - An optional other person who holds the account.
+        op_ - An optional other person who holds the account, by name.
 
         Returns nothing.
         """
@@ -264,87 +532,216 @@ class PictureGameBot:
             "you already gave out a few hints, try and make them easier."
         )
         if op_:
-            self.r_gamebot.send_message(op_, subject, text)
+            self.outbox.put("send_message", op_, subject, text, key=op_,
+                            dedupe="noanswer:{!s}".format(
+                                self.round and self.round.id),
+                            level=BACKGROUND)
 
+    @timed
     def create_challenge(self, run=True):
         """
         Internal: Reset the password and have the bot start a random
-          challenge from the challenges.txt file.
+          challenge from the challenges.txt file, taking one that was
+          already uploaded from the pool.
 
         run - Whether or not to run the challenge after creating it.
 
         Returns nothing.
         """
         self.reset_password()
-        challenges = open("challenges.txt").read().splitlines()
-        answer, address, *hints = sample(challenges).split("|")
-        query = ("https://maps.googleapis.com/maps/api/streetview"
-                 "?size=640x640&location={:s}&sensor=false").format(address)
-        path = "tmp/{:s}".format(address)
-        urlretrieve(query, path)
-        url = self.imgur.upload_image(path, title="PictureGame Challenge").link
-        newround = int(re.search(
-            r"^\[round (\d+)",
-            self.latest_round().title.lower()).group(1)) + 1
+        challenge, url = self.pool.take()
+        answer = AnswerMatcher.from_entry(challenge.answers,
+                                          self.answer_tolerance)
+        hints = challenge.hints
+        newround = self.rounds.number(self.latest_round()) + 1
         post = self.r_player.submit(
             self.subreddit,
             ("[Round {:d}] [Bot] In which iconic location was this Google"
              " Street-View image taken?").format(newround),
             url=url)
+        self.rounds.pin(post)
+        self.state.set("challenge", {"post": post.fullname,
+                                     "answers": challenge.answers,
+                                     "hints": hints, "given": 0})
         if run:
             self.run_challenge(post, answer, hints)
         else:
             return (post, answer, hints)
 
-    def run_challenge(self, post, answer, hints):
+    def resume_challenge(self):
+        """
+        Internal: Go on with the challenge that was running when the bot
+          stopped, if it is still the latest round and wasn't solved.
+
+        Returns nothing.
+        """
+        challenge = self.state.get("challenge")
+        if challenge is None:
+            return
+        post = self.r_player.get_info(thing_id=challenge["post"])
+        if (post is None or not unsolved(post)
+                or post.id != self.latest_round().id):
+            self.state.set("challenge", None)
+            return
+        print("Resuming the challenge in {:s}.".format(post.id))
+        answer = AnswerMatcher.from_entry(challenge["answers"],
+                                          self.answer_tolerance)
+        self.start_challenge(post, answer, challenge["hints"],
+                             challenge["given"], existing=True)
+
+    def start_challenge(self, post, answer, hints, given=0, existing=False):
+        """
+        Internal: Start looking for the answer to the challenge given on the
+          Submission object. The challenge is then run a pass at a time by
+          challenge_pass().
+
+        post     - A praw.objects.Submission object to run on.
+        answer   - A picturegamebot.matcher.AnswerMatcher of the accepted
+                   answers.
+        hints    - The hints to give after 30, 60 and 90 minutes.
+        given    - How many hints were given already.
+        existing - Whether to look at the comments the post already has,
+                   e.g. when resuming, since the comment stream only starts
+                   with the subreddit's newest comments.
+
+        Returns nothing.
         """
-        Internal: Runs the challenge given on the Submission object. When the
-          answer was found somewhere in the comments, the bot replies with
-          "+correct" and ends itself.
+        found = []
+
+        def check(comments):
+            for comment in comments:
+                if (comment.author is not None
+                        and not same_author(comment, post)):
+                    alias = answer.match(comment.body)
+                    if alias:
+                        found.append((comment, alias))
+                        return
+
+        self.stream.register(post, check)
+        if existing:
+            with priority(CRITICAL):
+                post.replace_more_comments(limit=None, threshold=0)
+                check(sorted(praw.helpers.flatten_tree(post.comments),
+                             key=lambda comment: comment.created_utc))
+        self.challenge = {"post": post, "hints": hints, "given": given,
+                          "found": found,
+                          "cadence": Cadence(self.poll_floor,
+                                             self.poll_ceiling,
+                                             name="challenge")}
+
+    def challenge_pass(self):
+        """
+        Internal: Look for the answer to the running challenge once. When
+          the answer was found in one of the new comments, the bot replies
+          with "+correct" from the player account and the challenge ends.
+          Hints are given when they are due, and the hints given so far are
+          kept in the state.
+
+        Returns the seconds to wait before the next pass, or None if the
+          challenge ended.
+        """
+        challenge = self.challenge
+        post, hints = challenge["post"], challenge["hints"]
+        with priority(CRITICAL):
+            fresh = self.stream.poll()
+            if challenge["found"]:
+                comment, alias = challenge["found"][0]
+                print("CORRECT ANSWER - {:s}".format(alias))
+                self.stream.unregister(post)
+                self.r_player.get_info(
+                    thing_id=comment.name).reply("+correct")
+                self.state.set("challenge", None)
+                self.challenge = None
+                return None
+        for number, minutes in enumerate((30, 60, 90)):
+            if challenge["given"] <= number and minutes_passed(post, minutes):
+                post.add_comment(hints[number])
+                challenge["given"] = number + 1
+                progress = self.state.get("challenge")
+                if progress is not None:
+                    progress["given"] = challenge["given"]
+                    self.state.set("challenge", progress)
+        cadence = challenge["cadence"]
+        cadence.record(len([comment for comment in fresh
+                            if comment.link_id == post.fullname]))
+        wait = cadence.interval()
+        if challenge["given"] < len(hints):
+            next_hint = deadline(post, 30 * (challenge["given"] + 1))
+            wait = min(wait, next_hint - time.time())
+        return max(0, wait)
+
+    def run_challenge(self, post, answer, hints, given=0):
+        """
+        Internal: Runs the challenge given on the Submission object until
+          it is answered.
 
         post   - A praw.objects.Submission object to run on.
-        answer - A string to look for in the comments.
+        answer - A picturegamebot.matcher.AnswerMatcher of the accepted
+                 answers.
+        hints  - The hints to give after 30, 60 and 90 minutes.
+        given  - How many hints were given already.
 
         Returns nothing.
         """
-        firsthint = secondhint = giveaway = None
+        self.start_challenge(post, answer, hints, given)
         while True:
-            post.refresh()
-            comments = praw.helpers.flatten_tree(post.comments)
-            for comment in comments:
-                if (answer.lower() in comment.body.lower()
-                        and comment.author != comment.submission.author):
-                    print("CORRECT ANSWER - {:s}".format(answer))
-                    comment.reply("+correct")
-                    return
-            if minutes_passed(post, 30) and not firsthint:
-                firsthint = post.add_comment(hints[0])
-            if minutes_passed(post, 60) and not secondhint:
-                secondhint = post.add_comment(hints[1])
-            if minutes_passed(post, 90) and not giveaway:
-                giveaway = post.add_comment(hints[2])
-            time.sleep(15)
-
-    def win(self, comment):
+            wait = self.challenge_pass()
+            if wait is None:
+                return
+            time.sleep(wait)
+
+    def send_reply(self, thing_id, text, distinguish=False):
+        """
+        Internal: Reply to a thing as the bot. Used by the outbox.
+
+        thing_id    - The fullname of the comment or submission.
+        text        - The text of the reply.
+        distinguish - Whether to distinguish the reply as a moderator.
+
+        Returns nothing.
+        """
+        reply = self.r_gamebot._add_comment(thing_id, text)
+        if distinguish:
+            reply.distinguish()
+
+    def set_link_flair(self, thing_id, text, css_class):
+        """
+        Internal: Set the flair of a submission. Used by the outbox.
+
+        thing_id  - The fullname of the submission.
+        text      - The flair text.
+        css_class - The flair CSS class.
+
+        Returns nothing.
+        """
+        post = self.r_gamebot.get_info(thing_id=thing_id)
+        self.subreddit.set_flair(post, text, css_class)
+
+    @timed
+    def win(self, comment, post=None):
         """
         Internal: So somebody got the right answer. First, add a win to his
-          flair. Then, congratulate the winner and send him the resetted
-          password via private message.
+          flair. Then, congratulate the winner, approve him and send him the
+          instructions via private message. The API calls are left to the
+          outbox, in this order, so this returns right away.
 
         comment - The winning comment.
+        post    - The round's praw.objects.Submission, if it is at hand.
 
         Regrets nothing.
         """
-        comment.reply(
+        post = post or comment.submission
+        winner = comment.author.name
+        curround = self.rounds.number(post)
+        self.outbox.put(
+            "reply", comment.name,
             "Congratulations, that was the correct answer! Please continue the "
             "game as soon as possible. You have been PM'd the instructions for "
-            "continuing the game."
-        ).distinguish()
-        curround = int(re.search(r"^\[round (\d+)",
-                                 comment.submission.title.lower())
-                       .group(1))
-        self.increment_flair(comment.author, curround)
-        comment.submission.set_flair("ROUND OVER", "over")
+            "continuing the game.", True,
+            key=winner, dedupe="win:" + comment.name)
+        self.outbox.put("increment_flair", winner, curround, key=winner)
+        self.outbox.put("link_flair", post.fullname, "ROUND OVER", "over",
+                        key=winner)
         subject = "Congratulations, you can post the next round!"
         text = (
             "Congratulations on winning the last round! "
@@ -358,10 +755,126 @@ class PictureGameBot:
         ).format(roundno=curround + 1,
                  username=self.player[0],
                  password=self.player[1])
-        self.r_gamebot.send_message(comment.author, subject, text)
-        self.subreddit.add_contributor(comment.author)
+        self.outbox.put("add_contributor", winner, key=winner)
+        self.outbox.put("send_message", winner, subject, text, key=winner)
         self.leaderboard.add(comment.author, curround, publish=True)
 
+    def schedule_unsolved(self, post):
+        """
+        Internal: Schedule the warning and the abandoning of an unsolved
+          round, 150 and 180 minutes after it was posted.
+
+        post - The praw.objects.Submission of the round.
+
+        Returns nothing.
+        """
+        self.scheduler.cancel("nopost", "takeover")
+        self.scheduler.set("noanswer", deadline(post, 150),
+                           self.on_noanswer)
+        self.scheduler.set("abandon", deadline(post, 180),
+                           partial(self.on_abandon, post))
+
+    def schedule_round_over(self, winner_comment):
+        """
+        Internal: Schedule the warning and the takeover of a solved round
+          that has no new post yet, 30 and 45 minutes after the winning
+          comment.
+
+        winner_comment - The comment that won the round.
+
+        Returns nothing.
+        """
+        self.scheduler.cancel("noanswer", "abandon")
+        self.scheduler.set("nopost", deadline(winner_comment, 30),
+                           self.on_nopost)
+        self.scheduler.set("takeover", deadline(winner_comment, 45),
+                           self.on_takeover)
+
+    def on_noanswer(self):
+        """
+        Internal: Runs when a round has not been solved for 150 minutes.
+
+        Returns nothing.
+        """
+        print("Not solved for 150 minutes. Warning.")
+        self.warn_noanswer(self.current_op)
+
+    def on_abandon(self, post):
+        """
+        Internal: Runs when a round has not been solved for 180 minutes. The
+          bot will take over on the next pass, when it sees the flair.
+
+        post - The praw.objects.Submission of the round.
+
+        Returns nothing.
+        """
+        print("Not solved for 180 minutes. Setting ABANDONED flair.")
+        post.set_flair("ABANDONED", "abandoned")
+        post.add_comment(
+            "This post has not been marked as solved for 3 "
+            "hours. The password of the account has been "
+            "reset and a new challenge will be created."
+        ).distinguish()
+
+    def on_nopost(self):
+        """
+        Internal: Runs when the winner hasn't posted for 30 minutes.
+
+        Returns nothing.
+        """
+        print("Not posted for 30 minutes. Warning.")
+        self.warn_nopost(self.current_op)
+
+    def on_takeover(self):
+        """
+        Internal: Runs when the winner hasn't posted for 45 minutes, or when
+          the latest round is dead or abandoned.
+
+        Returns nothing.
+        """
+        print("Taking over.")
+        self.scheduler.clear()
+        self.current_op = None
+        self.start_challenge(*self.create_challenge(run=False))
+
+    def tick(self):
+        """
+        Internal: Look at the latest round once, handing out the win if it
+          was just solved, and (re)schedule the deadlines of its state.
+
+        Returns nothing.
+        """
+        with priority(CRITICAL):
+            latest_round = self.latest_round()
+            if self.round is None or self.round.id != latest_round.id:
+                self.scheduler.clear()
+                self.round = latest_round
+                self.state.set("round", latest_round.id)
+            winner_comment = self.winner_comment(latest_round)
+        link_flair = latest_round.link_flair_text
+
+        if unsolved(latest_round):
+            if winner_comment is None:
+                self.schedule_unsolved(latest_round)
+            elif not self.processed(winner_comment):
+                print("New winner! PMing new password.")
+                self.win(winner_comment, latest_round)
+                correct = self.index.correct.get(winner_comment.name)
+                if correct is not None:
+                    self.metrics.observe("correct_reaction_seconds",
+                                         time.time() - correct.created_utc)
+                if self.current_op:
+                    self.outbox.put("remove_contributor", self.current_op,
+                                    key=self.current_op)
+                self.current_op = winner_comment.author.name
+                self.schedule_round_over(winner_comment)
+        elif re.search(link_flair, "ROUND OVER", re.IGNORECASE):
+            if winner_comment:
+                self.schedule_round_over(winner_comment)
+        elif re.search(link_flair, "DEAD ROUND|ABANDONED", re.IGNORECASE):
+            print("DEAD ROUND/ABANDONED flair detected.")
+            self.on_takeover()
+
     def run(self):
         """
         Public: Starts listening in the subreddit and does its thing.
@@ -371,103 +884,90 @@ class PictureGameBot:
             if POST HAS ANSWER:
               send instructions to winner and approve them to the sub
               remove the old OP
-              chill for a bit
-            or else:
-              if 150 MINUTES HAVE PASSED AND I HAVEN'T WARNED YET:
+            or else, at these deadlines:
+              150 MINUTES AFTER POSTING:
                 pm OP that he needs to provide hints before 30 minutes
-              if 180 MINUTES HAVE PASSED AND I WARNED YA:
+              180 MINUTES AFTER POSTING:
                 set the flair to ABANDONED
-                chill for a bit
                 (the bot will upload a new post next loop)
 
-          or else if LATEST POST HAS BEEN SOLVED:
-            if 30 MINUTES HAVE PASSED AND I HAVEN'T WARNED YET:
+          or else if LATEST POST HAS BEEN SOLVED, at these deadlines:
+            30 MINUTES AFTER THE WIN:
               pm OP that he needs to put a new post up before 15 minutes
-            if 45 MINUTES HAVE PASSED AND I WARNED YA:
+            45 MINUTES AFTER THE WIN:
               the bot will upload a new post
 
           or else if LATEST POST HAS BEEN KILLED (DEAD ROUND/ABANDONED):
             the bot will upload a new post
 
+          Between passes, the bot sleeps until the next deadline or the next
+          time it should look for an answer, whichever comes first. It looks
+          more often while the thread is busy or the OP is active, and less
+          often the longer it stays quiet.
+
         Returns nothing, it's a looping function.
         """
-        nopost_warning = False    # Warn if the user posts nothing for an hour.
-        noanswer_warning = False  # Warn if unsolved in 90 mins of posting.
-        current_op = None         # The person who owns the account. (optional)
+        exit_on_sigterm()
+        self.start()
         while True:
             try:
-                latest_round = self.latest_round()
-                winner_comment = self.winner_comment(latest_round)
-                link_flair = latest_round.link_flair_text
-
-                if (link_flair is None
-                            or link_flair == ""
-                            or re.search(link_flair, "UNSOLVED",
-                                         re.IGNORECASE)):
-                    nopost_warning = False
-                    if (winner_comment
-                            and not self.already_replied(winner_comment)):
-                        print("New winner! PMing new password.")
-                        self.win(winner_comment)
-                        self.subreddit.remove_contributor(current_op)
-                        current_op = winner_comment.author
-                        noanswer_warning = False
-                        time.sleep(60)
-                    else:
-                        if (minutes_passed(latest_round, 150)
-                                and not noanswer_warning):
-                            print("Not solved for 150 minutes. Warning.")
-                            self.warn_noanswer(current_op)
-                            noanswer_warning = True
-                        if (minutes_passed(latest_round, 180)
-                                and noanswer_warning):
-                            print("Not solved for 180 minutes. Setting"
-                                  "ABANDONED flair.")
-                            latest_round.set_flair("ABANDONED", "abandoned")
-                            noanswer_warning = False
-                            time.sleep(30)
-                            latest_round.add_comment(
-                              "This post has not been marked as solved for 3 "
-                              "hours. The password of the account has been "
-                              "reset and a new challenge will be created."
-                            ).distinguish()
-                elif re.search(link_flair, "ROUND OVER", re.IGNORECASE):
-                    if (minutes_passed(winner_comment, 30)
-                            and not nopost_warning):
-                        print("Not posted for 30 minutes. Warning.")
-                        self.warn_nopost(current_op)
-                        nopost_warning = True
-                    if (minutes_passed(winner_comment, 45)
-                            and nopost_warning):
-                        print("Not posted for 45 minutes. Taking over.")
-                        self.create_challenge()
-                        nopost_warning = False
-                        current_op = None
-                elif re.search(link_flair, "DEAD ROUND|ABANDONED",
-                               re.IGNORECASE):
-                    print("DEAD ROUND/ABANDONED flair detected. Taking over.")
-                    self.create_challenge()
-                    noanswer_warning = False
-                    current_op = None
-
-                time.sleep(30)
-
-            except (praw.errors.InvalidUserPass, praw.errors.NotLoggedIn):
-                self.r_gamebot.send_message(self.subreddit, "Password Issue!",
-                               "There has been an issue with the password. "
-                               "Please reset the password in /wiki/accounts.")
-                # Wait a minute for mods to solve the issue
-                time.sleep(60)
-                self.player = self.get_player_credentials()
-                self.r_player.login(self.player[0], self.player[1])
-            except requests.exceptions.HTTPError as error:
-                if error.response.status_code in [429, 500, 502, 503, 504]:
-                    print("Reddit is {:d}ing! Powering through...".format(
-                        error.response.status_code
-                    ))
-            except praw.errors.RateLimitExceeded as error:
-                print("Ratelimit: {:d} seconds".format(error.sleep_time))
-                time.sleep(error.sleep_time)
+                wait = self.step()
+                self.metrics.write(self.metrics_path)
+                time.sleep(wait)
             except KeyboardInterrupt:
                 print("CURRENT PASSWORD: {:s}".format(self.player[1]))
+                print(self.scheduler.report())
                 sys.exit(0)
+
+    def start(self):
+        """
+        Public: Get going after a (re)start: carry on with the challenge
+          that was running.
+
+        Returns nothing.
+        """
+        self.resume_challenge()
+
+    def step(self):
+        """
+        Public: Do one pass of the game: a pass of the running challenge if
+          there is one, or else a tick and the deadlines that are due, then
+          the commands in the inbox when it is time to read it. Errors from
+          reddit are handled here, so that a host can run many games a pass
+          at a time.
+
+        Returns the number of seconds to wait before the next pass.
+        """
+        try:
+            if self.relogin:
+                self.relogin = False
+                self.player = self.get_player_credentials()
+                if self._r_player is not None:
+                    self._r_player.login(self.player[0], self.player[1])
+            with self.metrics.time("loop_seconds"):
+                if self.challenge is not None:
+                    wait = self.challenge_pass()
+                    if wait is not None:
+                        self.commands.poll()
+                        return wait
+                self.tick()
+                self.scheduler.run_due()
+                self.commands.poll()
+            return self.scheduler.sleep_time(self.cadence.interval())
+
+        except (praw.errors.InvalidUserPass, praw.errors.NotLoggedIn):
+            self.r_gamebot.send_message(self.subreddit, "Password Issue!",
+                           "There has been an issue with the password. "
+                           "Please reset the password in /wiki/accounts.")
+            # Wait a minute for mods to solve the issue
+            self.relogin = True
+            return 60
+        except requests.exceptions.HTTPError as error:
+            if error.response.status_code in [429, 500, 502, 503, 504]:
+                print("Reddit is {:d}ing! Powering through...".format(
+                    error.response.status_code
+                ))
+            return self.poll_floor
+        except praw.errors.RateLimitExceeded as error:
+            print("Ratelimit: {:d} seconds".format(error.sleep_time))
+            return error.sleep_time
@@ -0,0 +1,95 @@
+"""
+Cadence
+"""
+
+import time
+from collections import deque
+
+
+class Cadence:
+    """
+    Picks how long to wait before polling again, from how many comments the
+    recent polls found. A busy thread is polled about as often as a few new
+    comments come in, a thread where the OP is answering guesses (so that a
+    +correct is likely) is polled as often as allowed, and a quiet thread is
+    polled half as often after every poll that found nothing.
+    """
+
+    def __init__(self, floor=5, ceiling=120, window=300, batch=3,
+                 clock=time.time, name="comments"):
+        """
+        Public: Create a cadence, starting at the floor.
+
+        floor   - The shortest interval, in seconds.
+        ceiling - The longest interval, in seconds.
+        window  - Seconds of polls to measure the comment rate over, and to
+                  poll at the floor for after the OP was active.
+        batch   - How many new comments a poll should find, on average,
+                  when the thread is busy.
+        clock   - A function returning the current UNIX time.
+        name    - What is polled, for the log.
+
+        Returns an instance of Cadence.
+        """
+        self.floor = floor
+        self.ceiling = ceiling
+        self.window = window
+        self.batch = batch
+        self.clock = clock
+        self.name = name
+        self.current = floor
+        self.logged = None
+        self.hot_until = 0
+        self._polls = deque()
+
+    def rate(self):
+        """
+        Public: The number of comments per second found over the window.
+
+        Returns a Float.
+        """
+        now = self.clock()
+        while self._polls and self._polls[0][0] < now - self.window:
+            self._polls.popleft()
+        if not self._polls:
+            return 0.0
+        span = max(now - self._polls[0][0], self.floor)
+        return sum(count for _, count in self._polls) / span
+
+    def record(self, count, hot=False):
+        """
+        Public: Record the result of a poll and pick the next interval.
+
+        count - The number of new comments the poll found.
+        hot   - Whether an answer is likely to be marked as correct soon,
+                e.g. because the OP just commented.
+
+        Returns the next interval, in seconds.
+        """
+        now = self.clock()
+        self._polls.append((now, count))
+        if hot:
+            self.hot_until = now + self.window
+        rate = self.rate()
+        if now < self.hot_until:
+            interval = self.floor
+        elif count:
+            interval = self.batch / rate
+        else:
+            interval = self.current * 2
+        self.current = max(self.floor, min(self.ceiling, interval))
+        return self.current
+
+    def interval(self):
+        """
+        Public: The interval picked after the last poll. Changes are
+          logged.
+
+        Returns a number of seconds.
+        """
+        seconds = int(round(self.current))
+        if seconds != self.logged:
+            print("Polling {:s} every {:d} seconds ({:.1f}/min).".format(
+                self.name, seconds, self.rate() * 60))
+            self.logged = seconds
+        return self.current
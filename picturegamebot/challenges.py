@@ -0,0 +1,206 @@
+"""
+Challenges
+"""
+
+import os
+import json
+import threading
+from random import choice as sample, shuffle
+
+
+class Challenge:
+    """
+    One line of the challenges.txt file: the accepted answers, the Street
+    View location and the hints, separated by "|".
+    """
+
+    def __init__(self, answers, address, hints):
+        """
+        Public: Create a challenge.
+
+        answers - A String of accepted answers separated by semicolons.
+        address - The URL-encoded Street View location.
+        hints   - A list of hint Strings, given at 30, 60 and 90 minutes.
+
+        Returns an instance of Challenge.
+        """
+        self.answers = answers
+        self.address = address
+        self.hints = hints
+
+    @classmethod
+    def parse(cls, line):
+        """
+        Public: Read a challenge from a line of challenges.txt.
+
+        line - A String in the form `answers|address|hint|hint|hint`.
+
+        Returns an instance of Challenge.
+        """
+        answers, address, *hints = line.split("|")
+        return cls(answers, address, hints)
+
+    @property
+    def query(self):
+        """
+        Public: The Street View URL of the challenge image.
+
+        Returns a String.
+        """
+        return ("https://maps.googleapis.com/maps/api/streetview"
+                "?size=640x640&location={:s}&sensor=false").format(
+                    self.address)
+
+def load_challenges(path="challenges.txt"):
+    """
+    Internal: Read every challenge in the challenges file.
+
+    path - The location of the file.
+
+    Returns a list of Challenge.
+    """
+    with open(path) as challenges:
+        return [Challenge.parse(line)
+                for line in challenges.read().splitlines() if line.strip()]
+
+
+class ChallengePool:
+    """
+    Keeps a few challenges downloaded and uploaded to Imgur ahead of time, so
+    that taking over a stalled game only has to submit a ready link. The
+    ready links are kept in a manifest file so that they survive a restart.
+    """
+
+    def __init__(self, imgur, challenges, cache, size=3, low=2,
+                 manifest="tmp/manifest.json", interval=300):
+        """
+        Public: Create a pool. Nothing is prepared until start() or take()
+          is called.
+
+        imgur      - A pyimgur.Imgur client to upload the images with.
+        challenges - A list of Challenge to pick from.
+        cache      - A picturegamebot.imagecache.ImageCache to get the
+                     Street View images from.
+        size       - How many challenges to keep ready when refilling.
+        low        - Refill once fewer than this many challenges are ready.
+        manifest   - Where to keep the ready links.
+        interval   - Seconds between checks of the background refiller.
+
+        Returns an instance of ChallengePool.
+        """
+        self.imgur = imgur
+        self.cache = cache
+        self.challenges = dict((c.address, c) for c in challenges)
+        self.size = min(size, len(self.challenges))
+        self.low = min(low, self.size)
+        self.manifest = manifest
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.ready = self._read_manifest()
+
+    def _read_manifest(self):
+        """
+        Private: Load the ready links, dropping the ones whose challenge was
+          removed from challenges.txt.
+
+        Returns a dict of addresses to Imgur links.
+        """
+        try:
+            with open(self.manifest) as manifest:
+                ready = json.load(manifest)
+        except (IOError, ValueError):
+            return {}
+        return dict((address, link) for address, link in ready.items()
+                    if address in self.challenges)
+
+    def _write_manifest(self):
+        """
+        Private: Save the ready links. Must be called with the lock held.
+
+        Returns nothing.
+        """
+        temp = self.manifest + ".new"
+        with open(temp, "w") as manifest:
+            json.dump(self.ready, manifest, indent=2)
+        os.replace(temp, self.manifest)
+
+    def prepare(self, challenge):
+        """
+        Internal: Get the Street View image of a challenge, from the cache if
+          it was downloaded before, and upload it to Imgur.
+
+        challenge - A Challenge.
+
+        Returns the Imgur link.
+        """
+        path = self.cache.get(challenge.query)
+        return self.imgur.upload_image(path,
+                                       title="PictureGame Challenge").link
+
+    def refill(self):
+        """
+        Public: Prepare challenges that aren't ready yet until the pool is
+          full, if fewer than `low` are ready.
+
+        Returns nothing.
+        """
+        with self._lock:
+            if len(self.ready) >= self.low:
+                return
+            wanted = [c for address, c in self.challenges.items()
+                      if address not in self.ready]
+        shuffle(wanted)
+        while wanted and len(self.ready) < self.size:
+            challenge = wanted.pop()
+            link = self.prepare(challenge)
+            with self._lock:
+                self.ready[challenge.address] = link
+                self._write_manifest()
+
+    def take(self):
+        """
+        Public: Take a random ready challenge out of the pool and wake the
+          refiller. If nothing is ready, a challenge is prepared right away.
+
+        Returns a tuple of the Challenge and its Imgur link.
+        """
+        with self._lock:
+            if self.ready:
+                address = sample(list(self.ready))
+                link = self.ready.pop(address)
+                self._write_manifest()
+                challenge = self.challenges[address]
+            else:
+                challenge = link = None
+        if challenge is None:
+            challenge = sample(list(self.challenges.values()))
+            link = self.prepare(challenge)
+        self._wake.set()
+        return challenge, link
+
+    def _run(self):
+        """
+        Private: The refiller thread, which refills every `interval` seconds
+          or whenever a challenge was taken.
+
+        Returns nothing.
+        """
+        while True:
+            try:
+                self.refill()
+            except Exception as error:
+                print("Could not prepare a challenge: {!s}".format(error))
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def start(self):
+        """
+        Public: Start refilling the pool in the background.
+
+        Returns nothing.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
@@ -0,0 +1,299 @@
+"""
+Commands
+"""
+
+import re
+import time
+import traceback
+from collections import defaultdict, deque
+
+from picturegamebot.transport import BACKGROUND, priority
+
+COMMAND = re.compile(r"^\s*!(\w+)((?:[ \t]+\S+)*)", re.MULTILINE)
+USERNAME = re.compile(r"^(?:/?u/)?([\w-]{3,20})$")
+NUMBER = re.compile(r"^[0-9]+$")
+
+
+def username(text):
+    """
+    Internal: Read a username, with or without /u/ in front of it.
+
+    Returns a String, or None if it isn't a valid username.
+    """
+    match = USERNAME.match(text)
+    if match:
+        return match.group(1)
+
+def number(text, limit=10 ** 9):
+    """
+    Internal: Read a whole number written with the digits 0 to 9. Numbers
+      over the limit are read as the limit, without converting all of their
+      digits.
+
+    text  - The String to read.
+    limit - The largest number to return.
+
+    Returns an Integer, or None if it isn't such a number.
+    """
+    if NUMBER.match(text):
+        if len(text) > len(str(limit)):
+            return limit
+        return min(int(text), limit)
+
+def minutes_left(due, now):
+    """
+    Internal: Describe how long until a deadline.
+
+    Returns a String.
+    """
+    minutes = max(0, int((due - now) // 60))
+    return "{:d} minute{:s}".format(minutes, "" if minutes == 1 else "s")
+
+
+class Commands:
+    """
+    Answers commands sent to the bot, in private messages or in replies to
+    its comments: !rank, !top, !round and, for moderators, !discredit and
+    !resync. The inbox is read a batch at a time every `interval` seconds,
+    behind the game's own requests, the answers are queued in the outbox,
+    and the batch is marked as read in one request. Answers come from the
+    leaderboard and the round the bot already has in memory, and each user
+    gets a few commands per window, so a flood of them can't hold the game
+    up. When several games share the bot's inbox, one of them reads it and
+    routes each message to the game it is about.
+    """
+
+    interval = 60      # Seconds between reads of the inbox.
+    batch = 25         # Most messages handled per read.
+    per_user = 3       # Commands answered per user per window.
+    window = 600       # Seconds of the per user limit.
+    max_top = 25       # Most users listed by !top.
+    moderators_ttl = 3600  # Seconds to remember the moderators for.
+
+    def __init__(self, bot, clock=time.time, reader=True, route=None):
+        """
+        Public: Create a command processor for a game. The inbox is first
+          read on the first poll.
+
+        bot    - The picturegamebot.bot.PictureGameBot to answer for.
+        clock  - A function returning the current UNIX time.
+        reader - Whether this game reads the inbox. Games that share the
+                 inbox with another one only answer what it routes to them.
+        route  - A function taking a message and returning the Commands to
+                 answer it with. (optional, this one answers everything)
+
+        Returns an instance of Commands.
+        """
+        self.bot = bot
+        self.clock = clock
+        self.reader = reader
+        self.route = route or (lambda message: self)
+        self.next_poll = 0
+        self.handlers = {"rank": self.rank, "top": self.top,
+                         "round": self.round, "discredit": self.discredit,
+                         "resync": self.resync}
+        self._recent = defaultdict(deque)
+        self._moderators = None
+        self._moderators_at = 0
+
+    def allowed(self, user):
+        """
+        Public: Count a command against a user's limit.
+
+        user - The name of the user.
+
+        Returns True if the command should be answered.
+        """
+        now = self.clock()
+        recent = self._recent[user.lower()]
+        while recent and recent[0] <= now - self.window:
+            recent.popleft()
+        if len(recent) >= self.per_user:
+            return False
+        recent.append(now)
+        return True
+
+    def is_moderator(self, user):
+        """
+        Public: Says whether a user moderates the subreddit. The list of
+          moderators is fetched at most once every moderators_ttl seconds.
+
+        user - The name of the user.
+
+        Returns a Boolean.
+        """
+        now = self.clock()
+        if (self._moderators is None
+                or now - self._moderators_at >= self.moderators_ttl):
+            self._moderators = set(str(moderator).lower() for moderator
+                                   in self.bot.subreddit.get_moderators())
+            self._moderators_at = now
+        return user.lower() in self._moderators
+
+    def rank(self, sender, args):
+        """
+        Internal: !rank [user] - The rank and wins of a user, by default the
+          sender.
+
+        Returns the answer, as a String.
+        """
+        name = username(args[0]) if args else sender
+        if name is None:
+            return "That isn't a username."
+        standing = self.bot.leaderboard.rank(name)
+        if standing is None:
+            return "/u/{:s} hasn't won a round yet.".format(name)
+        return "/u/{:s} is ranked #{:d} with {:d} win{:s}.".format(
+            name, standing[0], standing[1], "" if standing[1] == 1 else "s")
+
+    def top(self, sender, args):
+        """
+        Internal: !top [count] - The best users on the leaderboard.
+
+        Returns the answer, as a String.
+        """
+        count = number(args[0]) if args else None
+        count = max(1, min(10 if count is None else count, self.max_top))
+        rows = self.bot.leaderboard.top(count)
+        if not rows:
+            return "The leaderboard is empty."
+        return "".join(["Rank | Username | Wins\n", ":--:|:--|:--:\n"] +
+                       ["{:d} | /u/{:s} | {:d}\n".format(*row)
+                        for row in rows])
+
+    def round(self, sender, args):
+        """
+        Internal: !round - The current round, who holds the account and the
+          next deadline.
+
+        Returns the answer, as a String.
+        """
+        bot = self.bot
+        # The bot's challenge is the current round while it runs, though
+        # bot.round is only updated by the next tick.
+        challenge = bot.challenge
+        post = challenge["post"] if challenge is not None else bot.round
+        if post is None:
+            return "The bot hasn't found the current round yet."
+        lines = ["Round {!s}: [{:s}](https://redd.it/{:s})".format(
+            bot.rounds.number(post), post.title, post.id)]
+        if bot.current_op:
+            lines.append("The account is held by /u/{:s}.".format(
+                bot.current_op))
+        timers = bot.scheduler.timers
+        now = self.clock()
+        if challenge is not None:
+            lines.append("It's a bot challenge, with {:d} hint{:s} given."
+                         .format(challenge["given"],
+                                 "" if challenge["given"] == 1 else "s"))
+        elif "abandon" in timers:
+            lines.append("It's unsolved, and will be abandoned in {:s}."
+                         .format(minutes_left(timers["abandon"][0], now)))
+        elif "takeover" in timers:
+            lines.append("It's solved. The bot takes over if the next round "
+                         "isn't posted in {:s}.".format(
+                             minutes_left(timers["takeover"][0], now)))
+        return "\n\n".join(lines)
+
+    def discredit(self, sender, args):
+        """
+        Internal: !discredit N user - Take round N away from a user. Only
+          for moderators.
+
+        Returns the answer, as a String, or None to ignore the command.
+        """
+        if not self.is_moderator(sender):
+            return None
+        roundno = number(args[0]) if args else None
+        name = username(args[1]) if len(args) > 1 else None
+        if roundno is None or name is None:
+            return "Usage: !discredit <round number> <username>"
+        if str(roundno) not in self.bot.leaderboard.rounds(name):
+            return "/u/{:s} didn't win round {:d}.".format(name, roundno)
+        self.bot.discredit(
+            self.bot.r_gamebot.get_redditor(name, fetch=False), roundno)
+        print("{:s} discredited round {:d} from {:s}.".format(
+            sender, roundno, name))
+        return "Round {:d} was taken away from /u/{:s}.".format(roundno, name)
+
+    def resync(self, sender, args):
+        """
+        Internal: !resync - Make every flair in the subreddit match the
+          leaderboard, in the background. Only for moderators.
+
+        Returns the answer, as a String, or None to ignore the command.
+        """
+        if not self.is_moderator(sender):
+            return None
+        self.bot.outbox.put("resync_flairs", level=BACKGROUND)
+        print("{:s} asked for the flairs to be resynced.".format(sender))
+        return "The flairs will be resynced with the leaderboard shortly."
+
+    def answer(self, message):
+        """
+        Public: Work out the answer to a message.
+
+        message - A praw.objects.Message or praw.objects.Comment.
+
+        Returns a String, or None if there is nothing to answer.
+        """
+        if message.author is None:
+            return None
+        match = COMMAND.search(message.body)
+        if match is None or match.group(1).lower() not in self.handlers:
+            return None
+        sender = message.author.name
+        if not self.allowed(sender):
+            print("Ignoring a command from {:s}, too many.".format(sender))
+            return None
+        return self.handlers[match.group(1).lower()](
+            sender, match.group(2).split())
+
+    def handle(self, message):
+        """
+        Internal: Answer a message with the game it is about, through that
+          game's outbox.
+
+        message - A praw.objects.Message or praw.objects.Comment.
+
+        Returns nothing.
+        """
+        commands = self.route(message)
+        text = commands.answer(message)
+        if text is not None:
+            commands.bot.outbox.put("reply", message.name, text, False,
+                                    key=message.author.name,
+                                    dedupe="command:" + message.name,
+                                    level=BACKGROUND)
+
+    def poll(self):
+        """
+        Public: Answer the commands in the inbox, if it is time to read it
+          and this game reads it. A message that can't be answered is logged
+          and skipped, and the whole batch is marked as read either way, so
+          that one message can't hold up the inbox.
+
+        Returns the number of messages handled.
+        """
+        now = self.clock()
+        if not self.reader or now < self.next_poll:
+            return 0
+        self.next_poll = now + self.interval
+        session = self.bot.r_gamebot
+        with priority(BACKGROUND):
+            messages = list(session.get_unread(limit=self.batch))
+            try:
+                for message in reversed(messages):  # Oldest first.
+                    try:
+                        self.handle(message)
+                    except Exception:
+                        print("Couldn't answer {:s}:".format(message.name))
+                        traceback.print_exc()
+            finally:
+                if messages:
+                    session._mark_as_read([message.name
+                                           for message in messages])
+        if len(messages) == self.batch:
+            # There may be more, read them on the next pass.
+            self.next_poll = now
+        return len(messages)
@@ -0,0 +1,254 @@
+"""
+Comments
+"""
+
+from collections import OrderedDict
+
+
+def same_author(thing, other):
+    """
+    Internal: Says whether two things were written by the same (existing)
+      redditor. Compares names, since comparing praw.objects.Redditor
+      objects directly makes praw fetch both profiles.
+
+    thing - A praw.objects.Comment or praw.objects.Submission.
+    other - A praw.objects.Comment or praw.objects.Submission.
+
+    Returns a Boolean.
+    """
+    return (thing.author is not None and other.author is not None
+            and thing.author.name == other.author.name)
+
+def find_winner(index, parents):
+    """
+    Internal: Find the comment of a round that the OP marked as correct, by
+      replying "+correct" to it. The answers are looked up together, and
+      the first one marked that wasn't written by the OP wins.
+
+    index   - The picturegamebot.comments.CommentIndex of the round.
+    parents - A picturegamebot.comments.ParentCache to look the answers up.
+
+    Returns a praw.objects.Comment, or None.
+    """
+    found = parents.resolve(index.correct, index.comments)
+    for parent_id in index.correct:
+        parent = found.get(parent_id)
+        if (parent is not None
+                and parent.author is not None
+                and not same_author(parent, index.post)):
+            return parent
+
+
+class CommentIndex:
+    """
+    A per-round index of the comments the bot has already looked at, so that
+    every pass only has to deal with the comments that are new since the
+    last one.
+    """
+
+    def __init__(self, post):
+        """
+        Public: Create an empty index for a round.
+
+        post - The praw.objects.Submission of the round.
+
+        Returns an instance of CommentIndex.
+        """
+        self.post = post
+        self.comments = {}
+        self.correct = OrderedDict()
+        self.last_seen = None
+
+    def ingest(self, comments):
+        """
+        Public: Add comments to the index, skipping the ones that were
+          already seen. Replies by the OP containing "+correct" are kept in
+          self.correct, keyed by the fullname of the comment they answer.
+
+        comments - An iterable of praw.objects.Comment, oldest first.
+
+        Returns a list of the comments that were not seen before.
+        """
+        fresh = []
+        for comment in comments:
+            if comment.name in self.comments:
+                continue
+            self.comments[comment.name] = comment
+            fresh.append(comment)
+            if (comment.link_id == self.post.fullname
+                    and same_author(comment, self.post)
+                    and "+correct" in comment.body
+                    and not comment.is_root):
+                self.correct.setdefault(comment.parent_id, comment)
+        return fresh
+
+    def refresh(self):
+        """
+        Public: Fetch the OP's comments that are newer than the last one seen
+          and add them to the index. Only the OP can mark an answer as
+          correct, so their comment listing is all that is needed, and it is
+          only read up to the first comment that was already indexed. This
+          is used to catch up on a round, e.g. after a restart; after that,
+          a CommentStream keeps the index up to date.
+
+        Returns a list of the new comments.
+        """
+        author = self.post.author
+        if author is None:
+            return []
+        fresh = []
+        for comment in author.get_comments(sort="new", limit=None,
+                                           place_holder=self.last_seen):
+            if (comment.name in self.comments
+                    or comment.created_utc < self.post.created_utc):
+                break
+            fresh.append(comment)
+        if fresh:
+            self.last_seen = fresh[0].id
+        return self.ingest(reversed(fresh))
+
+
+class ParentCache:
+    """
+    A bounded cache of things looked up by fullname, used to resolve the
+    comments that were marked as correct without a round trip per comment.
+    """
+
+    batch_size = 100  # The most ids reddit accepts in one /api/info call.
+
+    def __init__(self, session, size=256):
+        """
+        Public: Create an empty cache.
+
+        session - A praw.Reddit session used for the lookups.
+        size    - The most things to keep before evicting the least recently
+                  used one.
+
+        Returns an instance of ParentCache.
+        """
+        self.session = session
+        self.size = size
+        self._things = OrderedDict()
+
+    def _store(self, thing):
+        """
+        Private: Put a thing in the cache, evicting the oldest entries when
+          it is full.
+
+        Returns nothing.
+        """
+        self._things[thing.name] = thing
+        self._things.move_to_end(thing.name)
+        while len(self._things) > self.size:
+            self._things.popitem(last=False)
+
+    def resolve(self, fullnames, loaded=None):
+        """
+        Public: Look up several things at once. Things that are cached or
+          already loaded are used as they are, and the rest are fetched in
+          as few /api/info requests as possible.
+
+        fullnames - An iterable of fullnames, e.g. "t1_c5s96e0".
+        loaded    - An optional dict of fullnames to things that were already
+                    fetched, e.g. CommentIndex.comments.
+
+        Returns a dict of fullnames to things. Things that could not be
+          found are left out.
+        """
+        found, missing = {}, []
+        for fullname in fullnames:
+            if fullname in self._things:
+                self._things.move_to_end(fullname)
+                found[fullname] = self._things[fullname]
+            elif loaded and fullname in loaded:
+                found[fullname] = loaded[fullname]
+                self._store(loaded[fullname])
+            elif fullname not in missing:
+                missing.append(fullname)
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            for thing in self.session.get_info(thing_id=batch) or []:
+                found[thing.name] = thing
+                self._store(thing)
+        return found
+
+
+class CommentStream:
+    """
+    Reads the subreddit's newest comments, once each, and hands them to the
+    handler of the round they were posted in. One paginated request per
+    pass replaces refreshing and flattening whole comment trees.
+    """
+
+    def __init__(self, session, subreddit, memory=1000):
+        """
+        Public: Create a stream that starts at the newest comment.
+
+        session   - A praw.Reddit session used to read the listing.
+        subreddit - A praw.objects.Subreddit to read the comments of.
+        memory    - How many comment fullnames to remember for deduplication.
+
+        Returns an instance of CommentStream.
+        """
+        self.session = session
+        self.subreddit = subreddit
+        self.memory = memory
+        self.handlers = {}
+        self.last_seen = None
+        self._seen = OrderedDict()
+
+    def register(self, post, handler):
+        """
+        Public: Send the new comments of a submission to a handler.
+
+        post    - A praw.objects.Submission.
+        handler - A function taking a list of praw.objects.Comment, oldest
+                  first.
+
+        Returns nothing.
+        """
+        self.handlers[post.fullname] = handler
+
+    def unregister(self, post):
+        """
+        Public: Stop sending the comments of a submission anywhere.
+
+        post - A praw.objects.Submission.
+
+        Returns nothing.
+        """
+        self.handlers.pop(post.fullname, None)
+
+    def poll(self):
+        """
+        Public: Fetch the comments posted since the last poll and dispatch
+          them. The first poll only reads the first page of the listing,
+          which is evicted from praw's cache first, since it is read with
+          the same URL on every poll.
+
+        Returns a list of the new comments, oldest first.
+        """
+        self.session.evict(self.session.config["subreddit_comments"] %
+                           self.subreddit)
+        fresh = []
+        limit = None if self.last_seen else 100
+        for comment in self.session.get_comments(self.subreddit, limit=limit,
+                                                 place_holder=self.last_seen):
+            if comment.name in self._seen:
+                break
+            fresh.append(comment)
+        if not fresh:
+            return fresh
+        self.last_seen = fresh[0].id
+        fresh.reverse()
+
+        by_post = OrderedDict()
+        for comment in fresh:
+            self._seen[comment.name] = True
+            by_post.setdefault(comment.link_id, []).append(comment)
+        while len(self._seen) > self.memory:
+            self._seen.popitem(last=False)
+        for link_id, comments in by_post.items():
+            if link_id in self.handlers:
+                self.handlers[link_id](comments)
+        return fresh
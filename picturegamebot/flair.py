@@ -0,0 +1,225 @@
+"""
+Flair
+"""
+
+import io
+import re
+import csv
+import threading
+
+from picturegamebot.metrics import timed
+
+WINS = re.compile(r"(\d+) wins")
+BOT_FLAIR = re.compile(r"^(Round \d+(, \d+)*|\d+ wins)$")
+
+
+def target_flair(rounds, current):
+    """
+    Internal: Work out the flair a user should have from the rounds they
+      won. Up to 7 wins are listed as "Round 1234, 2345", more are counted
+      as "8 wins". A flair already in the wins format keeps that format and
+      anything the mods added to it, e.g. "12 wins, Fair Play Award", and
+      flairs the bot didn't write are left alone.
+
+    rounds  - The list of rounds won, as Strings, in the order they were won.
+    current - The user's current flair text, or None.
+
+    Returns a String, or None if the flair shouldn't be touched.
+    """
+    if current and WINS.search(current):
+        if not rounds and BOT_FLAIR.match(current):
+            return ""
+        return WINS.sub("{:d} wins".format(len(rounds)), current, count=1)
+    if current and not current.startswith("Round"):
+        return None
+    if not rounds:
+        return ""
+    if len(rounds) >= 8:
+        return "{:d} wins".format(len(rounds))
+    return "Round " + ", ".join(rounds)
+
+def flair_csv(rows):
+    """
+    Internal: Write flair mappings in the CSV format of /api/flaircsv, quoting
+      the texts that have commas in them.
+
+    rows - A list of (username, text, css class) tuples.
+
+    Returns a String.
+    """
+    output = io.StringIO()
+    csv.writer(output, lineterminator="\n").writerows(rows)
+    return output.getvalue().rstrip("\n")
+
+
+class FlairSync:
+    """
+    Keeps the winners' flairs in line with the leaderboard. A single win
+    reads the winner's flair from reddit and writes it if it changes, as
+    before, so that a mod's edit isn't overwritten. The cache of every
+    user's flair text only saves requests in bulk: a resync reads the whole
+    flair list at once, and the flairs that differ from what the
+    leaderboard says are set with reddit's bulk flair endpoint, 100 users
+    per request.
+    """
+
+    batch = 100  # Lines per request, the most reddit accepts.
+
+    def __init__(self, subreddit, css_class="winner"):
+        """
+        Public: Create an empty cache. Flairs are fetched as they are needed,
+          or all at once by resync().
+
+        subreddit - A praw.objects.Subreddit, with its reddit session.
+        css_class - The CSS class of the winners' flair.
+
+        Returns an instance of FlairSync.
+        """
+        self.subreddit = subreddit
+        self.session = subreddit.reddit_session
+        self.css_class = css_class
+        self.known = {}
+        self.complete = False
+        self._lock = threading.Lock()
+
+    def _current(self, username, fresh=False):
+        """
+        Private: Get a user's flair text, from the cache or else from reddit.
+
+        username - The name of the user.
+        fresh    - Whether to ask reddit even if the flair is cached, since
+                   the mods may have edited it since.
+
+        Returns a String (empty without flair), or None if the user doesn't
+          exist.
+        """
+        key = username.lower()
+        if fresh or key not in self.known:
+            if self.complete and not fresh:
+                # Users missing from the whole list have no flair.
+                return ""
+            flair = self.subreddit.get_flair(username)
+            if flair is None:
+                return None
+            self.known[key] = flair["flair_text"] or ""
+        return self.known[key]
+
+    def _send(self, changes):
+        """
+        Private: Set flairs in bulk and update the cache with the ones reddit
+          accepted.
+
+        changes - A list of (username, text) tuples.
+
+        Returns nothing.
+        """
+        for start in range(0, len(changes), self.batch):
+            chunk = changes[start:start + self.batch]
+            rows = [(username, text, self.css_class if text else "")
+                    for username, text in chunk]
+            results = self.session.request_json(
+                self.session.config["flaircsv"],
+                data={"r": str(self.subreddit), "flair_csv": flair_csv(rows)})
+            for (username, text), result in zip(chunk, results):
+                if result.get("ok"):
+                    self.known[username.lower()] = text
+                else:
+                    print("Couldn't set the flair of {:s}: {!s}".format(
+                        username, result.get("errors")))
+        self.session.evict(self.session.config["flairlist"] %
+                           str(self.subreddit))
+
+    def _plan(self, wins, fresh=False):
+        """
+        Private: Work out the flairs that don't match the rounds won.
+
+        wins  - A dict of usernames to the list of rounds they won.
+        fresh - Whether to read the current flairs from reddit.
+
+        Returns a list of (username, current text, new text) tuples.
+        """
+        changes = []
+        for username, rounds in wins.items():
+            current = self._current(username, fresh)
+            if current is None:
+                continue
+            text = target_flair(rounds, current)
+            if text is not None and text != current:
+                changes.append((username, current, text))
+        return changes
+
+    def plan(self, wins):
+        """
+        Public: Work out which flairs reconcile() would change, without
+          changing them.
+
+        wins - A dict of usernames to the list of rounds they won.
+
+        Returns a list of (username, current text, new text) tuples.
+        """
+        with self._lock:
+            return self._plan(wins)
+
+    @timed
+    def update(self, username, rounds):
+        """
+        Public: Make one user's flair match the rounds they won, e.g. after a
+          win. Their flair is read from reddit rather than the cache, since
+          the mods may have edited it, so this costs a read and, if the flair
+          changes, a write.
+
+        username - The name of the user.
+        rounds   - The list of rounds they won.
+
+        Returns True if the flair was changed.
+        """
+        with self._lock:
+            changes = self._plan({username: rounds}, fresh=True)
+            if changes:
+                self._send([(name, text) for name, _, text in changes])
+            return bool(changes)
+
+    @timed
+    def reconcile(self, wins):
+        """
+        Public: Make the flairs of some users match the rounds they won, in
+          bulk, reading their flairs from the cache where they are known.
+
+        wins - A dict of usernames to the list of rounds they won.
+
+        Returns the number of flairs changed.
+        """
+        with self._lock:
+            changes = self._plan(wins)
+            if changes:
+                self._send([(username, text)
+                            for username, _, text in changes])
+            return len(changes)
+
+    @timed
+    def resync(self, wins):
+        """
+        Public: Reload every flair of the subreddit and fix the ones that
+          don't match the leaderboard, including the winners' flairs of
+          users who aren't on it anymore.
+
+        wins - A dict of every username on the leaderboard to the list of
+               rounds they won.
+
+        Returns the number of flairs changed.
+        """
+        with self._lock:
+            self.session.evict(self.session.config["flairlist"] %
+                               str(self.subreddit))
+            names = {}
+            self.known = {}
+            for flair in self.subreddit.get_flair_list(limit=None):
+                names[flair["user"].lower()] = flair["user"]
+                self.known[flair["user"].lower()] = flair["flair_text"] or ""
+            self.complete = True
+        everyone = dict((names[key], []) for key, text in self.known.items()
+                        if BOT_FLAIR.match(text))
+        for username, rounds in wins.items():
+            everyone.pop(names.get(username.lower()), None)
+            everyone[username] = rounds
+        return self.reconcile(everyone)
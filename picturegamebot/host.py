@@ -0,0 +1,204 @@
+"""
+Host
+"""
+
+import os
+import sys
+import time
+import heapq
+import atexit
+import threading
+import traceback
+import pyimgur
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from picturegamebot.bot import PictureGameBot, exit_on_sigterm
+from picturegamebot.challenges import ChallengePool, load_challenges
+from picturegamebot.imagecache import ImageCache
+from picturegamebot.metrics import REGISTRY, Profiler
+from picturegamebot.transport import Transport
+
+
+class GameHost:
+    """
+    Runs the game in several subreddits in one process. The games share the
+    bot account's session, the rate limit of the API, the image cache and
+    the challenge pool, and the players' sessions when two subreddits use
+    the same player account. Each game is stepped by a small thread pool
+    whenever its own cadence or deadlines say so, so a busy subreddit
+    doesn't hold back the quiet ones.
+    """
+
+    crash_delay = 60  # Seconds to wait after a game crashed.
+
+    def __init__(self, subreddits, gamebot=(None, None), imgurid=None,
+                 workers=4, transport=None, imgur=None):
+        """
+        Public: Log in once and set up a game for each subreddit.
+
+        subreddits - The names of the subreddits to host the game in.
+        gamebot    - The bot's reddit account's username and password.
+                     (optional if REDDIT_USERNAME and REDDIT_PASSWORD)
+        imgurid    - The Imgur client ID to upload challenges with.
+                     (optional if IMGUR_ID)
+        workers    - How many games can do a pass at the same time.
+        transport  - The picturegamebot.transport.Transport to use.
+                     (optional)
+        imgur      - The pyimgur.Imgur client to upload challenges with.
+                     (optional, made from imgurid)
+
+        Returns an instance of GameHost.
+        """
+        self.gamebot = (os.environ.get("REDDIT_USERNAME", gamebot[0]),
+                        os.environ.get("REDDIT_PASSWORD", gamebot[1]))
+        self.transport = transport or Transport()
+        atexit.register(self.transport.close)
+        self.r_gamebot = self.transport.reddit_session(
+            "{:s}, v{:s}".format(PictureGameBot.user_agent,
+                                 PictureGameBot.version))
+        self.r_gamebot.login(self.gamebot[0], self.gamebot[1])
+
+        self.imgur = imgur or pyimgur.Imgur(os.environ.get("IMGUR_ID",
+                                                           imgurid))
+        self.images = ImageCache(fetch=self.transport.download)
+        self.pool = ChallengePool(self.imgur, load_challenges(), self.images,
+                                  size=PictureGameBot.pool_size)
+        self.pool.start()
+
+        self.workers = workers
+        self._players = {}
+        self._passwords = {}
+        self._lock = threading.Lock()
+        self.games = [PictureGameBot(subreddit=name, host=self)
+                      for name in subreddits]
+        # The games share the bot's inbox, so only the first one reads it,
+        # and each message is answered by the game it is about.
+        for game in self.games[1:]:
+            game.commands.reader = False
+        self.games[0].commands.route = self.route
+
+        self.metrics = REGISTRY
+        if os.environ.get("METRICS_PORT"):
+            self.metrics.serve(int(os.environ["METRICS_PORT"]))
+        # The games are stepped by the workers, so their passes are
+        # profiled there, see run().
+        self.profiler = Profiler()
+        self.profiler.install()
+
+    def player_session(self, username, password):
+        """
+        Public: Get a reddit session logged in as a player account, shared
+          by the games using that account.
+
+        username - The player account's username.
+        password - Its password.
+
+        Returns a praw.Reddit.
+        """
+        with self._lock:
+            if username not in self._players:
+                session = self.transport.reddit_session(
+                    "/r/PictureGame Account")
+                session.login(username, password)
+                self._players[username] = session
+                self._passwords.setdefault(username, password)
+            return self._players[username]
+
+    def player_password(self, username):
+        """
+        Public: Get the current password of a player account, as the games
+          using it last set it.
+
+        username - The player account's username.
+
+        Returns a String, or None if no game set it yet.
+        """
+        with self._lock:
+            return self._passwords.get(username)
+
+    def set_player_password(self, username, password):
+        """
+        Public: Record a player account's password, e.g. after a game reset
+          it, for every game using the account.
+
+        username - The player account's username.
+        password - Its new password.
+
+        Returns nothing.
+        """
+        with self._lock:
+            self._passwords[username] = password
+
+    def route(self, message):
+        """
+        Public: Pick the game that should answer a message: the one of the
+          subreddit a comment reply was made in, or the first game for a
+          private message.
+
+        message - A praw.objects.Message or praw.objects.Comment.
+
+        Returns the game's picturegamebot.commands.Commands.
+        """
+        subreddit = getattr(message, "subreddit", None)
+        if subreddit is not None:
+            name = str(subreddit).lower()
+            for game in self.games:
+                if game.subreddit.display_name.lower() == name:
+                    return game.commands
+        return self.games[0].commands
+
+    def step(self, game):
+        """
+        Internal: Do one pass of a game. A game that crashes is logged and
+          retried later, so it doesn't take the other games down with it.
+
+        game - The picturegamebot.bot.PictureGameBot.
+
+        Returns the number of seconds to wait before its next pass.
+        """
+        try:
+            return game.step()
+        except Exception:
+            print("/r/{:s} crashed:".format(game.subreddit.display_name))
+            traceback.print_exc()
+            return self.crash_delay
+
+    def run(self):
+        """
+        Public: Run every game until interrupted. Each game is stepped when
+          the wait its last pass returned is over, on one of the workers.
+
+        Returns nothing, it's a looping function.
+        """
+        exit_on_sigterm()
+        for game in self.games:
+            try:
+                game.start()
+            except Exception:
+                traceback.print_exc()
+        due = [(time.time(), number) for number in range(len(self.games))]
+        heapq.heapify(due)
+        running = {}
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while True:
+                while due and due[0][0] <= time.time():
+                    number = heapq.heappop(due)[1]
+                    running[executor.submit(self.profiler.run, self.step,
+                                            self.games[number])] = number
+                timeout = max(0, due[0][0] - time.time()) if due else None
+                done, _ = wait(list(running), timeout=timeout,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    number = running.pop(future)
+                    heapq.heappush(due, (time.time() + future.result(),
+                                         number))
+                if done:
+                    self.metrics.write(PictureGameBot.metrics_path)
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False)
+            for game in self.games:
+                print("/r/{:s} CURRENT PASSWORD: {:s}".format(
+                    game.subreddit.display_name, game.player[1]))
+                print(game.scheduler.report())
+            sys.exit(0)
@@ -0,0 +1,184 @@
+"""
+Image Cache
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from urllib.request import urlopen
+
+
+def download(url):
+    """
+    Internal: Fetch the body of a URL.
+
+    url - The URL to fetch.
+
+    Returns bytes.
+    """
+    with urlopen(url) as response:
+        return response.read()
+
+
+class ImageCache:
+    """
+    Stores downloaded images on disk by the hash of their content, and looks
+    them up by the parameters of the request that produced them. The least
+    recently used images are evicted once the cache grows over its budget.
+    """
+
+    def __init__(self, directory="tmp/images", budget=50 * 1024 * 1024,
+                 fetch=download):
+        """
+        Public: Open (or create) a cache directory.
+
+        directory - Where to keep the images and the index.
+        budget    - The most bytes of images to keep.
+        fetch     - A function taking a URL and returning its body.
+
+        Returns an instance of ImageCache.
+        """
+        self.directory = directory
+        self.budget = budget
+        self.fetch = fetch
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, "index.json")
+
+    def _load_index(self):
+        """
+        Private: Read the index, dropping entries whose file is gone. The
+          blobs are kept least recently used first.
+
+        Returns nothing.
+        """
+        try:
+            with open(self.index_path) as index:
+                data = json.load(index)
+        except (IOError, ValueError):
+            data = {"keys": {}, "blobs": []}
+        self.blobs = OrderedDict(
+            (digest, size) for digest, size in data["blobs"]
+            if os.path.exists(self.path(digest)))
+        self.keys = dict((key, digest) for key, digest in data["keys"].items()
+                         if digest in self.blobs)
+
+    def _save_index(self):
+        """
+        Private: Write the index. Must be called with the lock held.
+
+        Returns nothing.
+        """
+        temp = self.index_path + ".new"
+        with open(temp, "w") as index:
+            json.dump({"keys": self.keys, "blobs": list(self.blobs.items())},
+                      index)
+        os.replace(temp, self.index_path)
+
+    def path(self, digest):
+        """
+        Public: The location of an image in the cache.
+
+        digest - The SHA-1 hex digest of the image.
+
+        Returns a String.
+        """
+        return os.path.join(self.directory, digest)
+
+    @staticmethod
+    def key(url):
+        """
+        Public: Turn a request into a cache key that doesn't depend on the
+          order or encoding of its parameters.
+
+        url - The URL of the request.
+
+        Returns a String.
+        """
+        parts = urlsplit(url)
+        params = sorted(parse_qsl(parts.query, keep_blank_values=True))
+        return "{:s}{:s}?{:s}".format(parts.netloc, parts.path,
+                                      urlencode(params))
+
+    @property
+    def size(self):
+        return sum(self.blobs.values())
+
+    def get(self, url):
+        """
+        Public: Get the image of a request from the cache, downloading it on
+          a miss.
+
+        url - The URL of the image.
+
+        Returns the path of the image on disk.
+        """
+        key = self.key(url)
+        with self._lock:
+            digest = self.keys.get(key)
+            if digest is not None:
+                self.hits += 1
+                self.blobs.move_to_end(digest)
+                self._save_index()
+                return self.path(digest)
+            self.misses += 1
+        content = self.fetch(url)
+        digest = hashlib.sha1(content).hexdigest()
+        with self._lock:
+            if digest not in self.blobs:
+                temp = "{:s}.{:d}".format(self.path(digest),
+                                          threading.get_ident())
+                with open(temp, "wb") as image:
+                    image.write(content)
+                os.replace(temp, self.path(digest))
+            self.blobs[digest] = len(content)
+            self.blobs.move_to_end(digest)
+            self.keys[key] = digest
+            self._evict(keep=digest)
+            self._save_index()
+        return self.path(digest)
+
+    def _evict(self, keep=None):
+        """
+        Private: Remove the least recently used images until the cache fits
+          in its budget. Must be called with the lock held.
+
+        keep - A digest to never evict, e.g. the image just stored.
+
+        Returns nothing.
+        """
+        total = self.size
+        for digest in list(self.blobs):
+            if total <= self.budget:
+                break
+            if digest == keep:
+                continue
+            total -= self.blobs.pop(digest)
+            self.evictions += 1
+            for key in [k for k, d in self.keys.items() if d == digest]:
+                del self.keys[key]
+            try:
+                os.remove(self.path(digest))
+            except OSError:
+                pass
+
+    def stats(self):
+        """
+        Public: Get the hit/miss statistics of the cache.
+
+        Returns a dict.
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "images": len(self.blobs), "bytes": self.size,
+                "budget": self.budget}
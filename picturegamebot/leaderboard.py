@@ -2,71 +2,438 @@
 Leaderboard
 """
 
+import os
+import re
+import json
+import hashlib
+import threading
 from html import unescape
 from xml.etree import ElementTree as ET
 
+from picturegamebot.metrics import timed
+from picturegamebot.ranking import RankIndex
+from picturegamebot.transport import BACKGROUND, priority
+
+def unescaped_chunks(html, size=65536):
+    """
+    Internal: Unescapes HTML a chunk at a time, never cutting an entity in
+      two.
+
+    html - The escaped String.
+    size - The number of characters to unescape at a time.
+
+    Yields Strings.
+    """
+    start = 0
+    while start < len(html):
+        end = start + size
+        entity = html.rfind("&", start, end)
+        if entity != -1 and html.find(";", entity, end) == -1:
+            end = max(entity, start + 1)
+        yield unescape(html[start:end])
+        start = end
+
+def digest(content):
+    """
+    Internal: Fingerprints the content of a page, to tell whether it would
+      change without keeping the whole content around.
+
+    Returns a hex String.
+    """
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+def iter_rows(html):
+    """
+    Internal: Reads the rows of the leaderboard tables in a page's HTML as
+      it is parsed, without building the whole document tree. Only rows
+      with data cells are read, so headers and other content are skipped.
+      Each row is taken out of the tree once it is read, so the memory used
+      doesn't grow with the number of rows.
+
+    html - The content_html of a wiki page, as given by reddit (escaped).
+
+    Yields tuples of a username and a list of round numbers.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    parents = []
+    for chunk in unescaped_chunks(html):
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == "start":
+                parents.append(element)
+                continue
+            parents.pop()
+            if element.tag != "tr":
+                continue
+            cells = list(element)
+            if len(cells) >= 3 and cells[0].tag == "td":
+                yield cells[1].text, (cells[2].text or "").split(", ")
+            if parents:
+                parents[-1].remove(element)
+            element.clear()
+    parser.close()
+
+
 class Leaderboard:
     """
     A class that manages the leaderboard. Woo OOP!
     """
 
-    _data = {}
+    max_reason = 256  # Reddit cuts longer edit reasons off.
 
-    def __init__(self, subreddit, page="leaderboard"):
+    def __init__(self, subreddit, page="leaderboard", window=60,
+                 snapshot=None, shard_size=None, state=None):
         """
         Public: Create/Load up a new Leaderboard.
 
         subreddit - A praw.objects.Subreddit. This should have the reddit
                     session available in it.
         page      - The optional location of the page in the wiki.
+        window    - Seconds to wait for more changes before publishing, so
+                    that they end up in one revision. 0 publishes at once.
+        snapshot  - Where to keep a local copy of the leaderboard, so that a
+                    restart doesn't need to download the whole page.
+                    Defaults to tmp/<subreddit>-<page>.json.
+        shard_size - If set, the table is split across the pages <page>/1,
+                     <page>/2, etc. with this many rows each, and <page>
+                     links to them. Only the pages that change are written.
+        state     - A picturegamebot.state.State to keep the changes that
+                    weren't published yet in, so that they survive a
+                    restart. (optional)
 
         Returns an instance of Leaderboard.
         """
         self.subreddit = subreddit
         self.page = page
+        self.window = window
+        self.shard_size = shard_size
+        self.state = state
+        self.snapshot = snapshot or "tmp/{!s}-{:s}.json".format(
+            subreddit, page.replace("/", "-"))
+        self.revision = None
+        self.shards = 0
+        self._data = None
+        self._pending = []
+        self._reasons = []
+        self._published = {}
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def _owns(self, page):
+        """
+        Private: Says whether a wiki page is part of the leaderboard.
+
+        page - The name of the page.
+
+        Returns a Boolean.
+        """
+        return page == self.page or page.startswith(self.page + "/")
+
+    def _revisions(self):
+        """
+        Private: Ask reddit for the latest revisions of the leaderboard, which
+          is much cheaper than getting the pages themselves. A sharded
+          leaderboard has to look at the revisions of the whole wiki.
+
+        Returns a list of dicts with an "id" and, usually, a "page", newest
+          first.
+        """
+        session = self.subreddit.reddit_session
+        path = "revisions" if self.shard_size else "revisions/" + self.page
+        url = session.config["wiki_page"] % (self.subreddit, path)
+        session.evict(url)
+        limit = 100 if self.shard_size else 1
+        return session.request_json(
+            url, params={"limit": limit})["data"]["children"]
+
+    def _latest_revision(self):
+        """
+        Private: Get the id of the latest revision of the leaderboard.
+
+        Returns the revision id, or None if there are no revisions.
+        """
+        revisions = self._revisions()
+        if revisions:
+            return revisions[0]["id"]
+
+    def _is_current(self):
+        """
+        Private: Says whether none of the leaderboard's pages were edited
+          since self.revision. If so, self.revision moves to the latest
+          revision, so that edits to other pages aren't looked at again.
+
+        Returns a Boolean.
+        """
+        if self.revision is None:
+            return False
+        revisions = self._revisions()
+        for revision in revisions:
+            if revision["id"] == self.revision:
+                self.revision = revisions[0]["id"]
+                return True
+            if self._owns(revision.get("page", self.page)):
+                return False
+        return False
+
+    def _read_snapshot(self):
+        """
+        Private: Load the local copy of the leaderboard, if none of its
+          pages were edited since it was saved.
+
+        Returns True if the copy was loaded.
+        """
+        try:
+            with open(self.snapshot) as snapshot:
+                data = json.load(snapshot)
+        except (IOError, ValueError):
+            return False
+        self.revision = data.get("revision")
+        if not self._is_current():
+            return False
+        self._data = RankIndex.from_rows(data["rows"])
+        self.shards = data.get("shards", 0)
+        self._published = data.get("published", {})
+        return True
+
+    def _write_snapshot(self):
+        """
+        Private: Save a local copy of the leaderboard and its revision.
+
+        Returns nothing.
+        """
+        rows = [(username, list(rounds))
+                for _, username, rounds, _ in self._data.rows()]
+        temp = self.snapshot + ".new"
+        with open(temp, "w") as snapshot:
+            json.dump({"revision": self.revision, "shards": self.shards,
+                       "published": self._published, "rows": rows}, snapshot)
+        os.replace(temp, self.snapshot)
+
+    def _shard_pages(self):
+        """
+        Private: Find the shards of the leaderboard in the wiki.
+
+        Returns a list of page names, in order.
+        """
+        pattern = re.compile(r"^{:s}/(\d+)$".format(re.escape(self.page)))
+        numbers = sorted(int(match.group(1)) for match in
+                         (pattern.match(page.page)
+                          for page in self.subreddit.get_wiki_pages())
+                         if match)
+        return ["{:s}/{:d}".format(self.page, number) for number in numbers]
+
+    def _fetch(self):
+        """
+        Private: Get the raw HTML data from reddit and parse it into _data, a
+          RankIndex of the usernames and the round numbers they won. It uses
+          the html content rather than the markdown content, since it's
+          computer-rendered and a bit more predictable. The rows are read
+          as the HTML is parsed, one page after the other.
+
+        Returns nothing.
+        """
+        revision = self._latest_revision()
+        names = [self.page]
+        if self.shard_size:
+            # A leaderboard that isn't sharded yet is still on the main page.
+            names = self._shard_pages() or names
+        self._published = {}
+        self._data = RankIndex.from_rows(
+            row for page in map(self._fetch_page, names)
+            for row in iter_rows(page.content_html))
+        self.revision = revision
+        self.shards = len(names) if names != [self.page] else 0
+        self._write_snapshot()
+
+    def _fetch_page(self, name):
+        """
+        Private: Get a page of the leaderboard, remembering a fingerprint of
+          its content so that it isn't written again unchanged.
+
+        name - The name of the page.
+
+        Returns a praw.objects.WikiPage.
+        """
+        page = self.subreddit.get_wiki_page(name)
+        self._published[name] = digest(unescape(page.content_md))
+        return page
 
     def _load(self):
         """
-        Private: Get the raw HTML data from reddit. This object is not part of
-          __init__ since it is lazily loaded. This would set _data to a dict,
-          where the keys are the usernames and the values are arrays of round
-          numbers won. It uses the html content rather than the markdown
-          content, since it's computer-rendered and a bit more predictable.
+        Private: Load the leaderboard. This is not part of __init__ since it
+          is lazily loaded. If the leaderboard wasn't edited since the local
+          snapshot was saved, the snapshot is used instead of downloading
+          the pages.
+
+        Returns nothing.
+        """
+        if self._data is None:
+            if not self._read_snapshot():
+                self._fetch()
+            self._resume()
+
+    def _remember(self):
+        """
+        Private: Save the changes that weren't published yet in the state.
+
+        Returns nothing.
+        """
+        if self.state is not None:
+            self.state.set("leaderboard:" + self.page,
+                           [list(change) for change in self._pending] or None)
+
+    def _resume(self):
+        """
+        Private: Apply the changes that weren't published before the last
+          restart, and publish them.
+
+        Returns nothing.
+        """
+        if self.state is None:
+            return
+        for action, username, roundno in self.state.get(
+                "leaderboard:" + self.page, []):
+            if getattr(self._data, action)(username, roundno):
+                self._pending.append((action, username, roundno))
+        self._remember()
+        if self._pending:
+            print("Resuming {:d} unpublished leaderboard changes.".format(
+                len(self._pending)))
+            self.publish("Changes from before a restart.")
+
+    def warm_up(self):
+        """
+        Public: Load the leaderboard in the background, behind the bot's more
+          urgent requests, so that the first win doesn't wait for it. If it
+          fails, it is loaded when it is first needed instead.
+
+        Returns nothing.
+        """
+        def load():
+            with priority(BACKGROUND), self._lock:
+                try:
+                    self._load()
+                except Exception as error:
+                    print("Couldn't load the leaderboard: {!s}".format(error))
+
+        threading.Thread(target=load, daemon=True).start()
+
+    def _revalidate(self):
+        """
+        Private: Make sure no one edited the leaderboard since it was loaded.
+          If someone did (e.g. a mod fixing the table by hand), it is loaded
+          again and the changes that weren't published yet are applied on
+          top of it, so that their edit isn't overwritten.
 
         Returns nothing.
         """
-        if not self._data:
-            html_data = self.subreddit.get_wiki_page(self.page).content_html
-            table = ET.XML(unescape(html_data)).find("table").find("tbody")
-            self._data = dict(
-                (row[1].text, row[2].text.split(", ")) for row in iter(table))
+        if self._is_current():
+            return
+        print("The leaderboard was edited on the wiki. Reloading it.")
+        self._fetch()
+        for action, username, roundno in self._pending:
+            getattr(self._data, action)(username, roundno)
+
+    def _render(self):
+        """
+        Private: Render every page of the leaderboard. When sharded, shards
+          that are no longer needed are emptied, and the main page links to
+          the shards with their rank ranges.
+
+        Yields tuples of a page name and its markdown content.
+        """
+        if not self.shard_size:
+            yield self.page, self.to_markdown()
+            return
+        count = max(1, -(-len(self._data) // self.shard_size))
+        links = []
+        for number in range(1, max(count, self.shards) + 1):
+            start = (number - 1) * self.shard_size
+            stop = start + self.shard_size
+            page = "{:s}/{:d}".format(self.page, number)
+            first = next(self._data.rows(start, start + 1), None)
+            last = next(self._data.rows(min(stop, len(self._data)) - 1,
+                                        stop), None)
+            if first:
+                links.append("* [Rank {:d} to {:d}](/r/{!s}/wiki/{:s})\n"
+                             .format(first[0], last[0], self.subreddit, page))
+            yield page, self.to_markdown(
+                "# Leaderboard, part {:d}\n\n".format(number), start, stop)
+        self.shards = count
+        yield self.page, "".join(["# Leaderboard\n\n"] + links)
 
-    def to_markdown(self, prepend="# Leaderboard\n\n"):
+    def to_markdown(self, prepend="# Leaderboard\n\n", start=0, stop=None):
         """
         Internal: Returns a leaderboard table of the data in markdown, adding
           columns for rank and total wins.
 
         prepend - A string to prepend to the table. Defaults to title.
+        start   - The position of the first row to render.
+        stop    - The position after the last row to render, or None.
 
         Returns a Markdown String.
         """
         self._load()
 
-        table = ("Rank | Username | Rounds won | Total |\n"
-                 "|:--:|:--:|:--|:--:|:--:|\n")
+        header = ("Rank | Username | Rounds won | Total |\n"
+                  "|:--:|:--:|:--|:--:|:--:|\n")
+        rows = ("{rank} | {username} | {rounds} | {total}\n".format(
+                    rank=rank, username=username, rounds=", ".join(rounds),
+                    total=wins)
+                for rank, username, rounds, wins in self._data.rows(start,
+                                                                    stop))
+        return "".join([prepend, header] + list(rows))
 
-        inv_map = {}
-        for username, rounds in self._data.items():
-            wins = len(rounds)
-            inv_map[wins] = inv_map.get(wins, [])
-            inv_map[wins].append(username)
-        for rank, wins in enumerate(sorted(inv_map, reverse=True)):
-            for username in inv_map[wins]:
-                table += "{rank} | {username} | {rounds} | {total}\n".format(
-                    rank=rank + 1, username=username,
-                    rounds=", ".join(self._data[username]), total=wins)
+    def rounds(self, username):
+        """
+        Public: Get the rounds won by a user.
 
-        return prepend + table
+        username - The name of the user.
+
+        Returns a list of Strings, in the order they were won.
+        """
+        with self._lock:
+            self._load()
+            return self._data.get(username)
+
+    def rank(self, username):
+        """
+        Public: Get the standing of a user.
+
+        username - The name of the user.
+
+        Returns a tuple of their rank and number of wins, or None if they
+          have no wins.
+        """
+        with self._lock:
+            self._load()
+            rank = self._data.rank(username)
+            if rank is not None:
+                return rank, self._data.wins(username)
+
+    def top(self, count):
+        """
+        Public: Get the best users.
+
+        count - How many users to return.
+
+        Returns a list of tuples of rank, username and number of wins.
+        """
+        with self._lock:
+            self._load()
+            return [(rank, username, wins) for rank, username, _, wins
+                    in self._data.top(count)]
+
+    def everyone(self):
+        """
+        Public: Get the rounds won by every user on the leaderboard.
+
+        Returns a dict of usernames to lists of Strings.
+        """
+        with self._lock:
+            self._load()
+            return dict((username, list(rounds))
+                        for _, username, rounds, _ in self._data.rows())
 
     def add(self, user, roundno, publish=False):
         """
@@ -78,10 +445,11 @@ class Leaderboard:
 
         Returns nothing.
         """
-        self._load()
-
-        self._data[user.name] = self._data.get(user.name, [])
-        self._data[user.name].append(str(roundno))
+        with self._lock:
+            self._load()
+            if self._data.add(user.name, str(roundno)):
+                self._pending.append(("add", user.name, str(roundno)))
+                self._remember()
         if publish:
             self.publish("{:s} won Round {:d}.".format(user.name, roundno))
 
@@ -95,22 +463,118 @@ class Leaderboard:
 
         Returns nothing.
         """
-        self._load()
-
-        if self._data.get(user.name) and str(roundno) in self._data[user.name]:
-            self._data[user.name].remove(str(roundno))
+        with self._lock:
+            self._load()
+            if self._data.remove(user.name, str(roundno)):
+                self._pending.append(("remove", user.name, str(roundno)))
+                self._remember()
         if publish:
             self.publish("Discredit Round {:d} from {:s}.".format(roundno,
                                                                   user.name))
 
+    def merge(self, rows, reason, dry_run=False):
+        """
+        Public: Add wins found elsewhere, e.g. in the round archive, to the
+          leaderboard, and publish them right away. Wins that are already on
+          it are kept, and a round it already credits to someone else stays
+          theirs, since the leaderboard goes back further than the archive.
+
+        rows    - An iterable of tuples of a username and a list of rounds.
+        reason  - The reason for the edit.
+        dry_run - Whether to only work out what would change.
+
+        Returns a tuple of a dict of usernames to the rounds added, and a
+          list of (round, username on the leaderboard, other username)
+          tuples of the rounds left alone.
+        """
+        with self._lock:
+            self._load()
+            self._revalidate()
+            owners = {}
+            for _, username, rounds, _ in self._data.rows():
+                for roundno in rounds:
+                    owners[roundno] = username
+            added = {}
+            conflicts = []
+            for username, rounds in rows:
+                for roundno in rounds:
+                    owner = owners.get(roundno)
+                    if owner is None:
+                        owners[roundno] = username
+                        added.setdefault(username, []).append(roundno)
+                    elif owner.lower() != username.lower():
+                        conflicts.append((roundno, owner, username))
+            if added and not dry_run:
+                for username, rounds in added.items():
+                    for roundno in rounds:
+                        if self._data.add(username, roundno):
+                            self._pending.append(("add", username, roundno))
+                self._remember()
+                self._reasons.append(reason)
+                self.flush()
+            return added, conflicts
+
+    @timed
     def publish(self, reason="Added a Win."):
         """
-        Internal: Publish any edits made to the wiki page.
+        Internal: Publish any edits made to the wiki page. Edits made within
+          the window are published together, when it is over.
 
         reason - The reason for the edit, usually for adding a win.
 
         Returns nothing.
         """
-        self._load()
-        self.subreddit.edit_wiki_page(self.page, self.to_markdown(),
-                                      reason=reason)
+        with self._lock:
+            self._reasons.append(reason)
+            if self.window <= 0:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window,
+                                              self._flush_later)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_later(self):
+        """
+        Private: Publish at the end of the window. The edits are made behind
+          the bot's more urgent requests.
+
+        Returns nothing.
+        """
+        with priority(BACKGROUND):
+            self.flush()
+
+    @timed
+    def flush(self):
+        """
+        Public: Publish the pending edits right away, in one revision (per
+          page) with all of their reasons. Pages that would not change are
+          not written, and edits made on the wiki in the meantime are kept.
+          Call this before shutting down.
+
+        Returns nothing.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._reasons:
+                return
+            reason = " ".join(self._reasons)
+            if len(reason) > self.max_reason:
+                reason = reason[:self.max_reason - 3] + "..."
+            self._load()
+            self._revalidate()
+            written = False
+            for page, content in self._render():
+                if digest(content) != self._published.get(page):
+                    self.subreddit.edit_wiki_page(page, content,
+                                                  reason=reason)
+                    self._published[page] = digest(content)
+                    written = True
+            if written:
+                self.revision = self._latest_revision()
+                self._write_snapshot()
+            self._reasons = []
+            self._pending = []
+            self._remember()
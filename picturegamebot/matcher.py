@@ -0,0 +1,199 @@
+"""
+Matcher
+"""
+
+import re
+import unicodedata
+
+
+def normalize(text):
+    """
+    Internal: Normalizes a string for answer matching. Accents are stripped,
+      the text is lowercased, and every run of punctuation or whitespace
+      becomes a single space. The result is padded with spaces so that
+      answers only match whole words.
+
+    text - The String to normalize.
+
+    Returns a String.
+    """
+    try:
+        text.encode("ascii")
+    except UnicodeEncodeError:
+        decomposed = unicodedata.normalize("NFKD", text)
+        text = "".join(char for char in decomposed
+                       if not unicodedata.combining(char))
+    words = re.findall(r"[^\W_]+", text.casefold())
+    return " {:s} ".format(" ".join(words))
+
+def edit_distance(first, second, limit):
+    """
+    Internal: Computes the Levenshtein distance between two strings, giving
+      up as soon as it is certain to be over the limit.
+
+    first  - A String.
+    second - A String.
+    limit  - The largest distance that is of interest.
+
+    Returns the distance, or limit + 1 if it is larger than the limit.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for i, char in enumerate(first, 1):
+        current = [i]
+        for j, other in enumerate(second, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (char != other)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+def pieces(pattern, count):
+    """
+    Internal: Splits a pattern into pieces of about the same length. If a
+      string is within count - 1 edits of the pattern, at least one of the
+      pieces appears in it unchanged, which makes a cheap filter.
+
+    pattern - The String to split.
+    count   - The number of pieces.
+
+    Returns a list of Strings.
+    """
+    size = len(pattern) // count
+    return [pattern[i * size:(i + 1) * size if i < count - 1 else None]
+            for i in range(count)]
+
+
+class AnswerMatcher:
+    """
+    Finds any of a challenge's accepted answers in a comment. The answers are
+    compiled once into an Aho-Corasick automaton, so a comment is scanned
+    once no matter how many aliases there are.
+    """
+
+    min_fuzzy_length = 5  # Shorter answers must be spelled exactly.
+
+    def __init__(self, aliases, tolerance=0):
+        """
+        Public: Compile a matcher for some answers.
+
+        aliases   - An iterable of accepted answers.
+        tolerance - The number of typos (edits) accepted in an answer.
+
+        Returns an instance of AnswerMatcher.
+        """
+        self.aliases = [alias.strip() for alias in aliases if alias.strip()]
+        self.tolerance = tolerance
+        self._patterns = [normalize(alias) for alias in self.aliases]
+        self._pieces = [pieces(pattern.strip(), tolerance + 1)
+                        for pattern in self._patterns]
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for number, pattern in enumerate(self._patterns):
+            self._add(pattern, number)
+        self._link()
+
+    @classmethod
+    def from_entry(cls, answers, tolerance=0):
+        """
+        Public: Create a matcher from the answer field of challenges.txt,
+          where the accepted answers are separated by semicolons.
+
+        answers   - A String, e.g. "Times Square;Times Sq".
+        tolerance - The number of typos accepted in an answer.
+
+        Returns an instance of AnswerMatcher.
+        """
+        return cls(answers.split(";"), tolerance)
+
+    def __str__(self):
+        return self.aliases[0] if self.aliases else ""
+
+    def _add(self, pattern, number):
+        """
+        Private: Add a pattern to the trie.
+
+        Returns nothing.
+        """
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].append(number)
+
+    def _link(self):
+        """
+        Private: Compute the failure links of the trie, breadth first.
+
+        Returns nothing.
+        """
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, target in self._goto[state].items():
+                queue.append(target)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[target] = self._goto[fallback].get(char, 0)
+                self._output[target] += self._output[self._fail[target]]
+
+    def _exact(self, text):
+        """
+        Private: Run the automaton over normalized text.
+
+        Returns the index of the first alias found, or None.
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                return output[state][0]
+
+    def _fuzzy(self, text):
+        """
+        Private: Compare every run of words in the text to the aliases that
+          have the same number of words, allowing a few typos. Aliases that
+          cannot be in the text at all are skipped before any comparison.
+
+        Returns the index of the first alias found, or None.
+        """
+        words = text.split()
+        for number, pattern in enumerate(self._patterns):
+            target = pattern.strip()
+            if (len(target) < self.min_fuzzy_length
+                    or not any(piece in text
+                               for piece in self._pieces[number])):
+                continue
+            size = target.count(" ") + 1
+            for start in range(len(words) - size + 1):
+                window = " ".join(words[start:start + size])
+                if abs(len(window) - len(target)) > self.tolerance:
+                    continue
+                if edit_distance(window, target,
+                                 self.tolerance) <= self.tolerance:
+                    return number
+
+    def match(self, text):
+        """
+        Public: Look for any of the answers in a piece of text.
+
+        text - The String to search, e.g. a comment body.
+
+        Returns the alias that was found, or None.
+        """
+        text = normalize(text)
+        number = self._exact(text)
+        if number is None and self.tolerance:
+            number = self._fuzzy(text)
+        if number is not None:
+            return self.aliases[number]
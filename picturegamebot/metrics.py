@@ -0,0 +1,315 @@
+"""
+Metrics
+"""
+
+import os
+import re
+import time
+import pstats
+import signal
+import cProfile
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit
+
+PREFIX = "picturegame_"
+
+# Parts of reddit's paths that name a thing rather than an endpoint.
+ENDPOINT_PATTERNS = [
+    (re.compile(r"/r/[^/]+"), "/r/{subreddit}"),
+    (re.compile(r"/comments/\w+.*"), "/comments/{id}"),
+    (re.compile(r"/(user|u)/[^/]+"), "/user/{name}"),
+    (re.compile(r"/wiki/(revisions/)?.+"), r"/wiki/\1{page}"),
+    (re.compile(r"\.json$"), ""),
+]
+
+
+def endpoint(url):
+    """
+    Internal: Turn a request URL into the name of its endpoint, without the
+      names of subreddits, users, pages or posts, so that calls to the same
+      endpoint are counted together.
+
+    url - The URL of the request.
+
+    Returns a String.
+    """
+    parts = urlsplit(url)
+    path = parts.path
+    for pattern, replacement in ENDPOINT_PATTERNS:
+        path = pattern.sub(replacement, path)
+    return "{:s}{:s}".format(parts.hostname or "", path or "/")
+
+def format_labels(labels):
+    """
+    Internal: Format labels the way Prometheus expects them.
+
+    labels - A tuple of (name, value) pairs.
+
+    Returns a String.
+    """
+    if not labels:
+        return ""
+    return "{{{:s}}}".format(",".join(
+        '{:s}="{:s}"'.format(name, str(value).replace("\\", "\\\\")
+                                              .replace('"', '\\"'))
+        for name, value in labels))
+
+
+class Metrics:
+    """
+    Counters and timings of what the bot does, exported in the Prometheus
+    text format. Timings are kept as a count, a sum and a maximum, which is
+    cheap enough to record on every call.
+    """
+
+    def __init__(self):
+        """
+        Public: Create an empty registry.
+
+        Returns an instance of Metrics.
+        """
+        self.counters = {}
+        self.timings = {}
+        self.help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        """
+        Public: Set the help text of a metric.
+
+        Returns nothing.
+        """
+        self.help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        """
+        Public: Add to a counter.
+
+        name   - The name of the counter, without the prefix.
+        amount - How much to add.
+        labels - The labels of the counter.
+
+        Returns nothing.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        """
+        Public: Record how long something took.
+
+        name    - The name of the timing, without the prefix.
+        seconds - The duration.
+        labels  - The labels of the timing.
+
+        Returns nothing.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            count, total, most = self.timings.get(key, (0, 0.0, 0.0))
+            self.timings[key] = (count + 1, total + seconds,
+                                 max(most, seconds))
+
+    @contextmanager
+    def time(self, name, **labels):
+        """
+        Public: Time the body of a with statement, even if it raises.
+
+        Returns a context manager.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, function):
+        """
+        Public: Decorate a function so that each call is timed, under the
+          "call_seconds" timing with the function's name as a label.
+
+        Returns the decorated function.
+        """
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.time("call_seconds", function=function.__name__):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def render(self):
+        """
+        Public: Export every metric in the Prometheus text format.
+
+        Returns a String.
+        """
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items())
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self.help:
+                    lines.append("# HELP {:s}{:s} {:s}".format(
+                        PREFIX, name, self.help[name]))
+                lines.append("# TYPE {:s}{:s} {:s}".format(PREFIX, name,
+                                                           kind))
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append("{:s}{:s}{:s} {!r}".format(
+                PREFIX, name, format_labels(labels), value))
+        for (name, labels), (count, total, _) in timings:
+            header(name, "summary")
+            labels = format_labels(labels)
+            lines.append("{:s}{:s}_count{:s} {:d}".format(PREFIX, name,
+                                                          labels, count))
+            lines.append("{:s}{:s}_sum{:s} {:.6f}".format(PREFIX, name,
+                                                          labels, total))
+        for (name, labels), (_, _, most) in timings:
+            header(name + "_max", "gauge")
+            lines.append("{:s}{:s}_max{:s} {:.6f}".format(
+                PREFIX, name, format_labels(labels), most))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Public: Write the metrics to a file, e.g. for node_exporter's
+          textfile collector. The file is replaced atomically.
+
+        path - The location of the file.
+
+        Returns nothing.
+        """
+        temp = path + ".new"
+        with open(temp, "w") as export:
+            export.write(self.render())
+        os.replace(temp, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Public: Serve the metrics over HTTP, from a daemon thread.
+
+        port - The port to listen on.
+        host - The address to listen on.
+
+        Returns the http.server.HTTPServer.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print("Serving metrics on http://{:s}:{:d}/".format(
+            host, server.server_port))
+        return server
+
+
+class Profiler:
+    """
+    A cProfile switch that can be flipped while the bot runs, by sending it
+    SIGUSR1. Switching it off writes the stats next to the metrics, to be
+    read with pstats or snakeviz. The thread that installed it (the main
+    loop) is profiled, and so are the calls other threads make through
+    run(), e.g. the passes of a host's games, each thread with its own
+    profile, all written to the same stats.
+    """
+
+    def __init__(self, directory="tmp"):
+        """
+        Public: Create a profiler that is switched off.
+
+        directory - Where to write the stats.
+
+        Returns an instance of Profiler.
+        """
+        self.directory = directory
+        self.profile = None
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def toggle(self, *_):
+        """
+        Public: Switch the profiler on or off. Can be used as a signal
+          handler.
+
+        Returns nothing.
+        """
+        if self.profile is None:
+            print("Profiling started.")
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.profile.disable()
+            with self._lock:
+                stats = pstats.Stats(self.profile)
+                for profile in self._threads.values():
+                    stats.add(profile)
+                self._threads = {}
+                self.profile = None
+            path = os.path.join(self.directory, "profile-{:d}.prof".format(
+                int(time.time())))
+            stats.dump_stats(path)
+            print("Profiling stopped. Stats written to {:s}".format(path))
+
+    def run(self, function, *args):
+        """
+        Public: Call a function, profiling it in the current thread's own
+          profile while the profiler is on. For threads other than the one
+          that installed it.
+
+        function - The function to call.
+        args     - Its arguments.
+
+        Returns what the function returns.
+        """
+        with self._lock:
+            if self.profile is None:
+                profile = None
+            else:
+                profile = self._threads.setdefault(threading.get_ident(),
+                                                   cProfile.Profile())
+        if profile is None:
+            return function(*args)
+        return profile.runcall(function, *args)
+
+    def install(self):
+        """
+        Public: Toggle the profiler on SIGUSR1, where there is such a
+          signal.
+
+        Returns nothing.
+        """
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self.toggle)
+
+
+REGISTRY = Metrics()
+REGISTRY.describe("call_seconds", "Time spent in the bot's hot paths.")
+REGISTRY.describe("api_request_seconds",
+                  "Time spent in HTTP requests, by endpoint and status.")
+REGISTRY.describe("api_wait_seconds",
+                  "Time requests waited for the rate limiter, by priority.")
+REGISTRY.describe("loop_seconds", "Time of a pass of the main loop.")
+REGISTRY.describe("correct_reaction_seconds",
+                  "Time from a +correct reply to the bot handing out the "
+                  "win.")
+timed = REGISTRY.timed
@@ -0,0 +1,220 @@
+"""
+Outbox
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+from queue import Queue
+
+import praw
+import requests
+
+from picturegamebot.transport import NORMAL, priority
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def retry_delay(error, attempt, backoff):
+    """
+    Internal: Says how long to wait before trying an action again after it
+      failed, if it should be tried again at all.
+
+    error   - The exception the action raised.
+    attempt - How many times the action was tried already.
+    backoff - The base delay, doubled on every attempt.
+
+    Returns a number of seconds, or None if the error is permanent.
+    """
+    if isinstance(error, praw.errors.RateLimitExceeded):
+        return error.sleep_time
+    if isinstance(error, requests.exceptions.HTTPError):
+        if error.response.status_code not in RETRY_STATUSES:
+            return None
+    elif not isinstance(error, (requests.exceptions.ConnectionError,
+                                requests.exceptions.Timeout)):
+        return None
+    return backoff * (2 ** (attempt - 1))
+
+
+class Outbox:
+    """
+    A durable queue of the bot's outgoing API calls (replies, flair, private
+    messages, contributor changes) that are made by a few worker threads, so
+    that the main loop never waits for them. Actions with the same key are
+    made by the same worker, in the order they were put in. Every action is
+    written to a journal first, and the ones that weren't done yet are put
+    back in the queue after a restart.
+    """
+
+    def __init__(self, handlers, path="tmp/outbox.jsonl", workers=2,
+                 attempts=5, backoff=2, state=None):
+        """
+        Public: Create an outbox and recover the actions left in its journal.
+          Nothing is done until start() is called.
+
+        handlers - A dict of action names to the functions doing them. The
+                   arguments of an action must be JSON serializable.
+        path     - The location of the journal.
+        workers  - The number of worker threads.
+        attempts - How many times to try an action before giving up.
+        backoff  - Seconds to wait before the first retry.
+        state    - A picturegamebot.state.State to remember the dedupe keys
+                   in, once their actions are journaled. Without it, they
+                   are forgotten once their actions are done and the
+                   journal is compacted. (optional)
+
+        Returns an instance of Outbox.
+        """
+        self.handlers = handlers
+        self.path = path
+        self.attempts = attempts
+        self.backoff = backoff
+        self.state = state
+        self.queues = [Queue() for _ in range(workers)]
+        self.sent = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._recover()
+
+    def _recover(self):
+        """
+        Private: Read the journal, requeue the actions that weren't done, and
+          rewrite the journal with only those.
+
+        Returns nothing.
+        """
+        pending = {}
+        try:
+            with open(self.path) as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by a crash.
+                    if entry.get("done"):
+                        pending.pop(entry["id"], None)
+                    else:
+                        pending[entry["id"]] = entry
+                        if entry.get("dedupe"):
+                            self.sent.add(entry["dedupe"])
+                            if self.state is not None:
+                                self.state.mark(entry["dedupe"])
+        except IOError:
+            pass
+        temp = self.path + ".new"
+        with open(temp, "w") as journal:
+            for entry in pending.values():
+                journal.write(json.dumps(entry) + "\n")
+        os.replace(temp, self.path)
+        for entry in pending.values():
+            print("Resuming {:s} from the outbox.".format(entry["action"]))
+            self._queue_for(entry).put(entry)
+
+    def _journal(self, entry):
+        """
+        Private: Append an entry to the journal and make sure it is on disk.
+
+        Returns nothing.
+        """
+        with self._lock:
+            with open(self.path, "a") as journal:
+                journal.write(json.dumps(entry) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+
+    def _queue_for(self, entry):
+        """
+        Private: Pick the worker of an action, by its key.
+
+        Returns a queue.Queue.
+        """
+        key = entry.get("key") or entry["id"]
+        return self.queues[sum(key.encode("utf-8")) % len(self.queues)]
+
+    def put(self, action, *args, key=None, dedupe=None, level=NORMAL):
+        """
+        Public: Queue an action.
+
+        action - The name of the action, one of the handlers.
+        args   - The arguments of the action.
+        key    - Actions with the same key are done in order, e.g. the name
+                 of the user they are about.
+        dedupe - If set, an action with the same dedupe key that was put in
+                 before (even before a restart) makes this one a no-op.
+        level  - The priority of the action's requests, see
+                 picturegamebot.transport.
+
+        Returns True if the action was queued.
+        """
+        if dedupe is not None:
+            with self._lock:
+                if self.was_sent(dedupe):
+                    return False
+                self.sent.add(dedupe)
+        entry = {"id": uuid.uuid4().hex, "action": action, "args": list(args),
+                 "key": key, "dedupe": dedupe, "level": level}
+        self._journal(entry)
+        if dedupe is not None and self.state is not None:
+            self.state.mark(dedupe)
+        self._queue_for(entry).put(entry)
+        return True
+
+    def was_sent(self, dedupe):
+        """
+        Public: Says whether an action with the given dedupe key was put in,
+          even before a restart.
+
+        Returns a Boolean.
+        """
+        return dedupe in self.sent or (self.state is not None
+                                       and self.state.marked(dedupe))
+
+    def _work(self, queue):
+        """
+        Private: A worker thread, doing the actions of one queue in order.
+
+        Returns nothing.
+        """
+        while True:
+            entry = queue.get()
+            for attempt in range(1, self.attempts + 1):
+                try:
+                    with priority(entry.get("level", NORMAL)):
+                        self.handlers[entry["action"]](*entry["args"])
+                    break
+                except Exception as error:
+                    delay = retry_delay(error, attempt, self.backoff)
+                    if delay is None or attempt == self.attempts:
+                        print("Giving up on {:s}: {!r}".format(
+                            entry["action"], error))
+                        break
+                    print("{:s} failed, retrying in {:d} seconds.".format(
+                        entry["action"], int(delay)))
+                    time.sleep(delay)
+            self._journal({"id": entry["id"], "done": True})
+            queue.task_done()
+
+    def start(self):
+        """
+        Public: Start the worker threads.
+
+        Returns nothing.
+        """
+        for queue in self.queues:
+            thread = threading.Thread(target=self._work, args=(queue,),
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self):
+        """
+        Public: Wait until every queued action is done, e.g. before shutting
+          down.
+
+        Returns nothing.
+        """
+        for queue in self.queues:
+            queue.join()
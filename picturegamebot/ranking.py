@@ -0,0 +1,168 @@
+"""
+Ranking
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from itertools import islice
+
+
+class RankIndex:
+    """
+    The users of the leaderboard, kept in order of their number of wins.
+    Users with the same number of wins share a bucket, and the distinct win
+    counts are kept sorted, so that adding or removing a win and looking up
+    a rank only take a binary search instead of sorting everybody. Each
+    user's rounds are kept in an OrderedDict, in the order they were won,
+    so that checking, adding and removing a round take constant time.
+    """
+
+    def __init__(self):
+        """
+        Public: Create an empty index.
+
+        Returns an instance of RankIndex.
+        """
+        self.rounds = {}
+        self.buckets = {}
+        self.levels = []
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Public: Build an index from (username, rounds) pairs.
+
+        rows - An iterable of tuples of a username and a list of rounds.
+               Empty rounds are ignored.
+
+        Returns an instance of RankIndex.
+        """
+        index = cls()
+        for username, rounds in rows:
+            for roundno in rounds:
+                if roundno:
+                    index.add(username, roundno)
+        return index
+
+    def __len__(self):
+        return len(self.rounds)
+
+    def __contains__(self, username):
+        return username in self.rounds
+
+    def _move(self, username, old, new):
+        """
+        Private: Move a user from the bucket of one win count to another.
+          A count of 0 means the user isn't in any bucket.
+
+        Returns nothing.
+        """
+        if old:
+            bucket = self.buckets[old]
+            del bucket[username]
+            if not bucket:
+                del self.buckets[old]
+                del self.levels[bisect_left(self.levels, old)]
+        if new:
+            if new not in self.buckets:
+                self.buckets[new] = OrderedDict()
+                insort(self.levels, new)
+            self.buckets[new][username] = None
+
+    def add(self, username, roundno):
+        """
+        Public: Add a round won by a user.
+
+        username - The name of the user.
+        roundno  - The round, as a String.
+
+        Returns True if the round was added, False if it was already there.
+        """
+        rounds = self.rounds.get(username)
+        if rounds is None:
+            rounds = self.rounds[username] = OrderedDict()
+        elif roundno in rounds:
+            return False
+        rounds[roundno] = None
+        self._move(username, len(rounds) - 1, len(rounds))
+        return True
+
+    def remove(self, username, roundno):
+        """
+        Public: Remove a round from a user. Users without wins are dropped.
+
+        username - The name of the user.
+        roundno  - The round, as a String.
+
+        Returns True if the round was removed, False if the user didn't
+          have it.
+        """
+        rounds = self.rounds.get(username)
+        if rounds is None or roundno not in rounds:
+            return False
+        del rounds[roundno]
+        self._move(username, len(rounds) + 1, len(rounds))
+        if not rounds:
+            del self.rounds[username]
+        return True
+
+    def get(self, username):
+        """
+        Public: Get the rounds won by a user.
+
+        Returns a list of Strings.
+        """
+        return list(self.rounds.get(username, ()))
+
+    def wins(self, username):
+        """
+        Public: Get the number of rounds won by a user.
+
+        Returns an Integer.
+        """
+        return len(self.rounds.get(username, ()))
+
+    def rank(self, username):
+        """
+        Public: Get the rank of a user. Users with the same number of wins
+          share a rank, and the next number of wins gets the next rank.
+
+        Returns an Integer, or None if the user has no wins.
+        """
+        wins = self.wins(username)
+        if wins:
+            return len(self.levels) - bisect_right(self.levels, wins) + 1
+
+    def rows(self, start=0, stop=None):
+        """
+        Public: Iterate over a range of the leaderboard, best first. Buckets
+          before the start are skipped without looking at their users.
+
+        start - The position of the first row, counting from 0.
+        stop  - The position after the last row, or None for all of them.
+
+        Yields tuples of rank, username, rounds and number of wins. The
+          rounds are an ordered iterable that belongs to the index and must
+          not be changed.
+        """
+        position = 0
+        for rank, wins in enumerate(reversed(self.levels), 1):
+            if stop is not None and position >= stop:
+                return
+            bucket = self.buckets[wins]
+            if position + len(bucket) > start:
+                first = max(start - position, 0)
+                last = None if stop is None else stop - position
+                for username in islice(bucket, first, last):
+                    yield rank, username, self.rounds[username], wins
+            position += len(bucket)
+
+    def top(self, count):
+        """
+        Public: Get the best users.
+
+        count - How many users to return.
+
+        Returns a list of tuples like the ones yielded by rows().
+        """
+        return list(self.rows(0, count))
@@ -0,0 +1,126 @@
+"""
+Rounds
+"""
+
+import re
+import time
+from collections import OrderedDict
+
+ROUND_TITLE = re.compile(r"^\[round (\d+)", re.IGNORECASE)
+
+
+class RoundTracker:
+    """
+    Keeps track of the active round. Between transitions, a pass costs one
+    listing of the posts newer than the round (which is usually empty) and
+    a refresh of the round itself, instead of reading /new and matching
+    titles until a round shows up. A full scan is only done at startup,
+    when the round disappears, and every `resync` seconds as a safety net.
+    """
+
+    def __init__(self, subreddit, resync=600, clock=time.time, memory=256):
+        """
+        Public: Create a tracker. Nothing is fetched until latest() is
+          called.
+
+        subreddit - A praw.objects.Subreddit, with its reddit session.
+        resync    - Seconds between full scans of /new.
+        clock     - A function returning the current UNIX time.
+        memory    - How many parsed round numbers to remember.
+
+        Returns an instance of RoundTracker.
+        """
+        self.subreddit = subreddit
+        self.session = subreddit.reddit_session
+        self.resync = resync
+        self.clock = clock
+        self.memory = memory
+        self.current = None
+        self.scanned = None
+        self._numbers = OrderedDict()
+
+    def number(self, post):
+        """
+        Public: Get the round number of a post from its title. Each post's
+          title is only parsed once.
+
+        post - A praw.objects.Submission.
+
+        Returns an Integer, or None if the post isn't a round.
+        """
+        if post.fullname not in self._numbers:
+            match = ROUND_TITLE.search(post.title)
+            self._numbers[post.fullname] = int(match.group(1)) if match \
+                else None
+            while len(self._numbers) > self.memory:
+                self._numbers.popitem(last=False)
+        return self._numbers[post.fullname]
+
+    def pin(self, post):
+        """
+        Public: Make a post the active round, e.g. one the bot just
+          submitted.
+
+        Returns nothing.
+        """
+        self.current = post
+
+    def _listing(self):
+        """
+        Private: The URL of the subreddit's /new listing.
+
+        Returns a String.
+        """
+        return (self.session.config["subreddit"] % self.subreddit) + "new/"
+
+    def _scan(self):
+        """
+        Private: Find the newest round in /new, reading as many pages as
+          needed.
+
+        Returns a praw.objects.Submission.
+        """
+        self.session.evict(self._listing())
+        self.scanned = self.clock()
+        return next(post for post in self.subreddit.get_new(limit=None)
+                    if self.number(post) is not None)
+
+    def _newer(self):
+        """
+        Private: Find rounds posted after the active one.
+
+        Returns a list of praw.objects.Submission, newest first.
+        """
+        self.session.evict(self._listing())
+        newer = self.subreddit.get_new(
+            limit=100, params={"before": self.current.fullname})
+        return [post for post in newer if self.number(post) is not None]
+
+    def _refresh(self):
+        """
+        Private: Fetch the active round again, e.g. for its flair.
+
+        Returns a praw.objects.Submission, or None if it is gone.
+        """
+        self.session.evict(self.session.config["info"])
+        post = self.session.get_info(thing_id=self.current.fullname)
+        if post is not None and post.author is not None:
+            return post
+
+    def latest(self):
+        """
+        Public: Get the active round, fresh.
+
+        Returns a praw.objects.Submission.
+        """
+        if (self.current is None or self.scanned is None
+                or self.clock() - self.scanned >= self.resync):
+            self.current = self._scan()
+            return self.current
+        newer = self._newer()
+        if newer:
+            self.current = newer[0]
+            return self.current
+        post = self._refresh()
+        self.current = post or self._scan()
+        return self.current
@@ -0,0 +1,138 @@
+"""
+Schedule
+"""
+
+import time
+
+
+class Scheduler:
+    """
+    Keeps the deadlines of the current round (warnings, abandoning, taking
+    over) and runs each of them once when it is due.
+    """
+
+    def __init__(self, clock=time.time, state=None):
+        """
+        Public: Create an empty schedule.
+
+        clock - A function returning the current UNIX time.
+        state - A picturegamebot.state.State to remember the timers that
+                fired in, so that they don't fire again after a restart.
+                (optional)
+
+        Returns an instance of Scheduler.
+        """
+        self.clock = clock
+        self.state = state
+        self.timers = {}
+        self.fired = set()
+
+    @staticmethod
+    def _mark(name, due):
+        return "deadline:{:s}:{:d}".format(name, int(due))
+
+    def has_fired(self, name, due):
+        """
+        Public: Says whether a timer already ran at the given due time.
+
+        Returns a Boolean.
+        """
+        return ((name, due) in self.fired or self.state is not None
+                and self.state.marked(self._mark(name, due)))
+
+    def set(self, name, due, handler):
+        """
+        Public: Schedule a handler, replacing any other timer with the same
+          name. A timer that already fired at the same due time is not set
+          again, so the same deadline can be scheduled on every pass.
+
+        name    - A String naming the timer, e.g. "noanswer".
+        due     - The UNIX time at which the handler should run.
+        handler - A function taking no arguments.
+
+        Returns nothing.
+        """
+        if self.has_fired(name, due):
+            return
+        if name not in self.timers or self.timers[name][0] != due:
+            print("Scheduled {:s} for {:s}.".format(
+                name, time.strftime("%H:%M:%S", time.gmtime(due))))
+        self.timers[name] = (due, handler)
+
+    def cancel(self, *names):
+        """
+        Public: Remove timers if they are scheduled.
+
+        names - The names of the timers.
+
+        Returns nothing.
+        """
+        for name in names:
+            self.timers.pop(name, None)
+
+    def clear(self):
+        """
+        Public: Forget every timer, e.g. when a new round starts.
+
+        Returns nothing.
+        """
+        self.timers.clear()
+        self.fired.clear()
+
+    def next_due(self):
+        """
+        Public: Get the time of the next deadline.
+
+        Returns the UNIX time, or None if nothing is scheduled.
+        """
+        if self.timers:
+            return min(due for due, _ in self.timers.values())
+
+    def run_due(self):
+        """
+        Public: Run every handler whose deadline has passed, earliest first.
+          A timer only counts as fired once its handler returned, so one
+          that raised is set again on the next pass.
+
+        Returns nothing.
+        """
+        now = self.clock()
+        due_timers = sorted((due, name) for name, (due, _) in
+                            self.timers.items() if due <= now)
+        for due, name in due_timers:
+            if self.timers.get(name, (None,))[0] != due:
+                continue  # Rescheduled or cancelled by an earlier handler.
+            _, handler = self.timers.pop(name)
+            handler()
+            self.fired.add((name, due))
+            if self.state is not None:
+                self.state.mark(self._mark(name, due))
+
+    def sleep_time(self, ceiling):
+        """
+        Public: How long to sleep before anything needs to happen, which is
+          until the next deadline, or at most the time until the next
+          expected event.
+
+        ceiling - The most seconds to sleep, e.g. the polling interval.
+
+        Returns a number of seconds.
+        """
+        next_due = self.next_due()
+        if next_due is None:
+            return ceiling
+        return max(0, min(ceiling, next_due - self.clock()))
+
+    def report(self):
+        """
+        Public: Describe the scheduled timers, for debugging.
+
+        Returns a String with one line per timer, earliest first.
+        """
+        now = self.clock()
+        return "\n".join(
+            "{:s}: due {:s} (in {:d}s)".format(
+                name, time.strftime("%H:%M:%S", time.gmtime(due)),
+                int(due - now))
+            for due, name in sorted((due, name) for name, (due, _) in
+                                    self.timers.items()))
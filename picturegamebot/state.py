@@ -0,0 +1,113 @@
+"""
+State
+"""
+
+import json
+import time
+import sqlite3
+import threading
+
+
+class State:
+    """
+    The bot's memory across restarts, in a small SQLite database: named
+    values (the current round, the current OP, the progress of a challenge)
+    and marks recording that something was done once (a win handed out, a
+    warning sent, a deadline run). Everything is read once when the store is
+    opened, so lookups never touch the disk, and every change is committed
+    before the call returns.
+    """
+
+    max_age = 30 * 24 * 3600  # Seconds to remember marks for.
+
+    def __init__(self, path="tmp/state.sqlite3", clock=time.time):
+        """
+        Public: Open (or create) the store and load it.
+
+        path  - The location of the database.
+        clock - A function returning the current UNIX time.
+
+        Returns an instance of State.
+        """
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self.new = not self._db.execute(
+            "SELECT name FROM sqlite_master WHERE name = 'vars'").fetchone()
+        self._db.execute("CREATE TABLE IF NOT EXISTS vars "
+                         "(key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS marks "
+                         "(mark TEXT PRIMARY KEY, created REAL NOT NULL)")
+        self._db.execute("DELETE FROM marks WHERE created < ?",
+                         (clock() - self.max_age,))
+        self.vars = dict((key, json.loads(value)) for key, value in
+                         self._db.execute("SELECT key, value FROM vars"))
+        self.marks = set(mark for mark, in
+                         self._db.execute("SELECT mark FROM marks"))
+
+    def get(self, key, default=None):
+        """
+        Public: Get a value.
+
+        key     - The name of the value.
+        default - What to return if the value was never set.
+
+        Returns the value, as it was JSON encoded.
+        """
+        return self.vars.get(key, default)
+
+    def set(self, key, value):
+        """
+        Public: Set a value, or delete it if it is None.
+
+        key   - The name of the value.
+        value - A JSON serializable value.
+
+        Returns nothing.
+        """
+        with self._lock:
+            if value is None:
+                self.vars.pop(key, None)
+                self._db.execute("DELETE FROM vars WHERE key = ?", (key,))
+            else:
+                self.vars[key] = value
+                self._db.execute(
+                    "INSERT OR REPLACE INTO vars (key, value) VALUES (?, ?)",
+                    (key, json.dumps(value)))
+
+    def mark(self, mark):
+        """
+        Public: Record that something was done.
+
+        mark - A String naming what was done, e.g. "win:t1_c5s96e0".
+
+        Returns True if it wasn't marked before.
+        """
+        with self._lock:
+            if mark in self.marks:
+                return False
+            self.marks.add(mark)
+            self._db.execute("INSERT OR IGNORE INTO marks (mark, created) "
+                             "VALUES (?, ?)", (mark, self.clock()))
+            return True
+
+    def marked(self, mark):
+        """
+        Public: Says whether something was done.
+
+        Returns a Boolean.
+        """
+        return mark in self.marks
+
+    def close(self):
+        """
+        Public: Close the database.
+
+        Returns nothing.
+        """
+        with self._lock:
+            self._db.close()
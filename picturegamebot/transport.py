@@ -0,0 +1,277 @@
+"""
+Transport
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import praw
+import requests
+from praw.handlers import DefaultHandler
+from requests.adapters import HTTPAdapter
+
+from picturegamebot.metrics import REGISTRY, endpoint
+
+# Request priorities, most urgent first.
+CRITICAL = 0    # Winner detection and +correct handling.
+NORMAL = 1      # Everything else on the main loop.
+BACKGROUND = 2  # Warnings, leaderboard writes, preparing challenges.
+
+_local = threading.local()
+
+
+def current_priority():
+    """
+    Internal: The priority of the requests made by the current thread.
+
+    Returns an Integer.
+    """
+    return getattr(_local, "priority", NORMAL)
+
+@contextmanager
+def priority(level):
+    """
+    Public: Make the requests of the current thread with a priority.
+
+    level - CRITICAL, NORMAL or BACKGROUND.
+
+    Returns a context manager.
+    """
+    previous = current_priority()
+    _local.priority = level
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+class RateLimiter:
+    """
+    A token bucket shared by every thread and session talking to one API.
+    Waiting requests are let through most urgent first, and the bucket is
+    corrected from the rate limit headers of the responses, so that the
+    budget is respected before the API starts refusing requests.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        """
+        Public: Create a full bucket.
+
+        rate  - Tokens added per second.
+        burst - The most tokens the bucket holds.
+        clock - A monotonic clock, in seconds.
+
+        Returns an instance of RateLimiter.
+        """
+        self.rate = self.default_rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.clock = clock
+        self.updated = clock()
+        self.reset_at = None
+        self._waiting = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        """
+        Private: Add the tokens earned since the last refill. Must be called
+          with the lock held.
+
+        Returns nothing.
+        """
+        now = self.clock()
+        if self.reset_at is not None and now >= self.reset_at:
+            self.reset_at = None
+            self.rate = self.default_rate
+            self.tokens = max(self.tokens, 1)
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, level=NORMAL):
+        """
+        Public: Wait for a token. Requests with a lower level go first.
+
+        level - The priority of the request.
+
+        Returns nothing.
+        """
+        with self._cond:
+            ticket = (level, next(self._order))
+            heapq.heappush(self._waiting, ticket)
+            while True:
+                self._refill()
+                if self._waiting[0] == ticket and self.tokens >= 1:
+                    break
+                wait = None  # Until the request ahead is let through.
+                if self._waiting[0] != ticket:
+                    pass
+                elif self.rate:
+                    wait = (1 - self.tokens) / self.rate
+                elif self.reset_at is not None:
+                    wait = self.reset_at - self.clock()
+                else:
+                    wait = 1
+                self._cond.wait(wait)
+            heapq.heappop(self._waiting)
+            self.tokens -= 1
+            self._cond.notify_all()
+
+    def update(self, headers):
+        """
+        Public: Correct the bucket from a response's rate limit headers, if
+          it has any. The remaining requests are spread over the time left
+          until the limit resets.
+
+        headers - The headers of a response.
+
+        Returns nothing.
+        """
+        try:
+            remaining = float(headers["x-ratelimit-remaining"])
+            reset = float(headers["x-ratelimit-reset"])
+        except (KeyError, ValueError):
+            return
+        with self._cond:
+            self._refill()
+            self.tokens = min(self.tokens, remaining)
+            if reset > 0:
+                self.rate = max(remaining, 0) / reset
+                self.reset_at = self.clock() + reset
+            self._cond.notify_all()
+
+
+class LimitedAdapter(HTTPAdapter):
+    """
+    A pooled HTTP adapter that takes a token from the rate limiter of the
+    host before each request.
+    """
+
+    def __init__(self, limiters, **kwargs):
+        """
+        Public: Create an adapter.
+
+        limiters - A dict of host suffixes (e.g. "reddit.com") to
+                   RateLimiters. Other hosts are not limited.
+        kwargs   - Passed to requests.adapters.HTTPAdapter, e.g.
+                   pool_maxsize.
+
+        Returns an instance of LimitedAdapter.
+        """
+        self.limiters = limiters
+        super().__init__(**kwargs)
+
+    def limiter(self, url):
+        """
+        Public: Find the rate limiter of a URL.
+
+        Returns a RateLimiter, or None.
+        """
+        host = urlsplit(url).hostname or ""
+        for suffix, limiter in self.limiters.items():
+            if host == suffix or host.endswith("." + suffix):
+                return limiter
+
+    def send(self, request, **kwargs):
+        limiter = self.limiter(request.url)
+        if limiter:
+            level = current_priority()
+            with REGISTRY.time("api_wait_seconds", priority=level):
+                limiter.acquire(level)
+        status = "error"
+        start = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+            status = response.status_code
+        finally:
+            REGISTRY.observe("api_request_seconds",
+                             time.perf_counter() - start,
+                             endpoint=endpoint(request.url),
+                             method=request.method, status=status)
+        if limiter:
+            limiter.update(response.headers)
+        return response
+
+
+class TransportHandler(DefaultHandler):
+    """
+    A praw handler that sends through the shared transport instead of a
+    session of its own, and leaves the pacing of requests to the shared
+    rate limiter instead of praw's fixed per-request delay.
+    """
+
+    def __init__(self, http):
+        self.http = http
+
+    def __del__(self):
+        pass  # The session is shared; it is closed by the Transport.
+
+    def _send(self, request, proxies, timeout, **_):
+        return self.http.send(request, proxies=proxies, timeout=timeout,
+                              allow_redirects=False)
+
+TransportHandler.request = DefaultHandler.with_cache(TransportHandler._send)
+
+
+class Transport:
+    """
+    One HTTP layer for everything the bot talks to: both reddit sessions and
+    the Street View downloads share keep-alive connections and reddit's
+    request budget.
+    """
+
+    def __init__(self, reddit_rate=0.5, burst=10, pool_size=10):
+        """
+        Public: Create the transport.
+
+        reddit_rate - Requests per second to reddit until its headers say
+                      otherwise.
+        burst       - Requests that can be made at once after a quiet spell.
+        pool_size   - Connections kept open per host.
+
+        Returns an instance of Transport.
+        """
+        self.reddit = RateLimiter(reddit_rate, burst)
+        self.adapter = LimitedAdapter({"reddit.com": self.reddit},
+                                      pool_connections=pool_size,
+                                      pool_maxsize=pool_size)
+        self.http = requests.Session()
+        self.http.mount("http://", self.adapter)
+        self.http.mount("https://", self.adapter)
+        self.handler = TransportHandler(self.http)
+
+    def reddit_session(self, user_agent):
+        """
+        Public: Create a praw session that sends through the transport.
+
+        user_agent - The user agent of the session.
+
+        Returns a praw.Reddit.
+        """
+        return praw.Reddit(user_agent, handler=self.handler,
+                           api_request_delay=0)
+
+    def download(self, url):
+        """
+        Public: Fetch the body of a URL.
+
+        url - The URL to fetch.
+
+        Returns bytes.
+        """
+        response = self.http.get(url, timeout=30)
+        response.raise_for_status()
+        return response.content
+
+    def close(self):
+        """
+        Public: Close the pooled connections.
+
+        Returns nothing.
+        """
+        self.http.close()
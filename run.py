@@ -1,2 +1,9 @@
+import os
 from picturegamebot.bot import PictureGameBot
-PictureGameBot(subreddit="PictureGame").run()
+from picturegamebot.host import GameHost
+
+subreddits = os.environ.get("SUBREDDITS", "PictureGame").split(",")
+if len(subreddits) == 1:
+    PictureGameBot(subreddit=subreddits[0]).run()
+else:
+    GameHost(subreddits).run()